@@ -1,150 +1,561 @@
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 
+from operators import opPower
+from factor_cache import fingerprint_arrays, row_checksums
+from data_processing import load_mmep_data_from_store, mmep_store_signatures, SharedMMEPPanel
+from profiling import profile_stage
 
-def calculate_five_minute_alpha_factors(mmep_data):
+
+# Number of minutes aggregated into one factor interval
+BUCKET_MINUTES = 5
+
+# Dtype of compact factor outputs: the smallest signed integer holding a count over one interval
+COMPACT_FACTOR_DTYPE = np.min_scalar_type(-BUCKET_MINUTES)
+
+# Version of the factor definitions; bump it whenever a factor changes so that cached results are recomputed
+FACTOR_VERSION = 1
+
+
+def _five_minute_blocks(mmep_data, fields):
     """
-    Calculate Alpha factors at 5-minute intervals for all stocks in the data.
-    
+    Reshape each field of an MMEP DataFrame into a dense NumPy block of shape (days, buckets, 5, stocks).
+
+    Every day is laid out on its own minute axis (tidx), padded with NaN up to a whole number of 5-minute
+    buckets, so that windowed operations can be done along the minute axis without crossing day boundaries.
+
+    float32 fields (see data_processing.COMPACT_MMEP_DTYPES) keep float32 blocks; every other field, including
+    nullable integers whose missing values become NaN, is reshaped into float64.
+
     :param mmep_data: MMEP-format DataFrame with multi-index (didx, tidx)
-    :return: A dictionary of DataFrames containing different Alpha factors, indexed by (didx, tidx // 5).
+    :param fields: List of field names to reshape
+    :return: A tuple (blocks, positions, index, stocks) where blocks maps field -> ndarray, positions is the pair of
+             (day, bucket) position arrays of the buckets present in the data, index is the matching
+             (didx, tidx // 5) MultiIndex and stocks is the common stock column Index.
+    """
+    stocks = mmep_data.columns.get_level_values(1).unique()
+    return _five_minute_blocks_from_arrays(
+        lambda field: _field_values(mmep_data, field, stocks), fields,
+        mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx'), stocks)
+
+
+def _field_values(mmep_data, field, stocks):
+    """
+    Values of one field as a (rows x stocks) array: float32 if every column of the field is float32, otherwise
+    float64 (missing values of nullable integer columns become NaN).
+    """
+    field_data = mmep_data.xs(field, level=0, axis=1).reindex(columns=stocks)
+    dtype = np.float32 if (field_data.dtypes == np.float32).all() else np.float64
+    return field_data.to_numpy(dtype=dtype, na_value=np.nan)
+
+
+def _five_minute_blocks_from_arrays(field_values, fields, didx, tidx, stocks):
+    """
+    Reshape (rows x stocks) field arrays into dense (days, buckets, 5, stocks) blocks; see _five_minute_blocks.
+
+    :param field_values: Function mapping a field name to its (rows x stocks) float array
+    :param fields: List of field names to reshape
+    :param didx: Date of every row
+    :param tidx: Minute of every row
+    :param stocks: Stock labels of the array columns
+    """
+    tidx = np.asarray(tidx, dtype=np.int64)
+    day_codes, days = pd.factorize(didx, sort=True)
+
+    n_days = len(days)
+    n_buckets = int(tidx.max()) // BUCKET_MINUTES + 1 if len(tidx) else 0
+    n_minutes = n_buckets * BUCKET_MINUTES
+
+    blocks = {}
+    for field in fields:
+        values = field_values(field)
+        block = np.full((n_days, n_minutes, len(stocks)), np.nan, dtype=values.dtype)
+        block[day_codes, tidx] = values
+        blocks[field] = block.reshape(n_days, n_buckets, BUCKET_MINUTES, len(stocks))
+
+    # Buckets that actually contain data, in the same (sorted) order as a groupby on (didx, tidx // 5)
+    present = np.unique(day_codes * n_buckets + tidx // BUCKET_MINUTES)
+    index = pd.MultiIndex.from_arrays([days[present // n_buckets], present % n_buckets], names=['didx', 'tidx'])
+    return blocks, (present // n_buckets, present % n_buckets), index, stocks
+
+
+def _rolling_mean_5(block):
+    """
+    Trailing 5-minute mean along the minute axis of a (days, buckets, 5, stocks) block, reset at every day.
+
+    The first four minutes of each day (or any window containing NaN) have no mean, like rolling(5).mean().
+    """
+    n_days, n_buckets, _, n_stocks = block.shape
+    x = block.reshape(n_days, n_buckets * BUCKET_MINUTES, n_stocks)
+    mean = np.full_like(x, np.nan)
+    mean[:, 4:] = ((((x[:, :-4] + x[:, 1:-3]) + x[:, 2:-2]) + x[:, 3:-1]) + x[:, 4:]) / 5
+    return mean.reshape(block.shape)
+
+
+def _pct_change(block):
+    """
+    Minute-over-minute percentage change along the minute axis, forward-filling gaps and reset at every day.
+    """
+    n_days, n_buckets, _, n_stocks = block.shape
+    x = block.reshape(n_days, n_buckets * BUCKET_MINUTES, n_stocks)
+    # Forward fill within each day
+    positions = np.where(np.isnan(x), 0, np.arange(x.shape[1])[None, :, None])
+    np.maximum.accumulate(positions, axis=1, out=positions)
+    filled = np.take_along_axis(x, positions, axis=1)
+    change = np.full_like(x, np.nan)
+    change[:, 1:] = filled[:, 1:] / filled[:, :-1] - 1
+    return change.reshape(block.shape)
+
+
+# Registries of intermediates and factors: name -> {'inputs': [...], 'func': ...}. Inputs are raw MMEP fields or
+# other intermediates; every function receives its inputs as (days, buckets, 5, stocks) blocks, in order.
+INTERMEDIATES = {}
+FACTOR_REGISTRY = {}
+
+
+def register_intermediate(name, inputs):
+    """
+    Decorator registering an intermediate shared between factors.
+
+    :param name: Name of the intermediate
+    :param inputs: List of raw field or intermediate names the function takes, in order
+    """
+    def decorator(func):
+        INTERMEDIATES[name] = {'inputs': list(inputs), 'func': func}
+        return func
+    return decorator
+
+
+def register_factor(name, inputs):
+    """
+    Decorator registering a 5-minute factor. The function returns one value per (day, bucket, stock).
+
+    :param name: Name of the factor, e.g. 'alpha1'
+    :param inputs: List of raw field or intermediate names the function takes, in order
+    """
+    def decorator(func):
+        FACTOR_REGISTRY[name] = {'inputs': list(inputs), 'func': func}
+        return func
+    return decorator
+
+
+def _count(condition):
+    """
+    Count the minutes of each bucket where the condition holds (NaN comparisons are False).
+    """
+    return condition.sum(axis=2)
+
+
+@register_intermediate('volume_imbalance', ['lift_volume', 'hit_volume'])
+def _volume_imbalance(lift_volume, hit_volume):
+    return lift_volume - hit_volume
+
+
+@register_intermediate('avg_lift_volume_5min', ['lift_volume'])
+def _avg_lift_volume_5min(lift_volume):
+    return _rolling_mean_5(lift_volume)
+
+
+@register_intermediate('avg_hit_volume_5min', ['hit_volume'])
+def _avg_hit_volume_5min(hit_volume):
+    return _rolling_mean_5(hit_volume)
+
+
+@register_intermediate('avg_num_trade_5min', ['num_trade'])
+def _avg_num_trade_5min(num_trade):
+    return _rolling_mean_5(num_trade)
+
+
+@register_intermediate('close_pct_change', ['close'])
+def _close_pct_change(close):
+    return _pct_change(close)
+
+
+# Alpha1: Number of times active buy volume > active sell volume within 5 minutes
+@register_factor('alpha1', ['volume_imbalance'])
+def _alpha1(volume_imbalance):
+    return _count(volume_imbalance > 0)
+
+
+# Alpha2: Bid-ask VWAP imbalance in 5-minute intervals
+@register_factor('alpha2', ['ask_twap', 'bid_twap', 'vwap'])
+def _alpha2(ask_twap, bid_twap, vwap):
+    return -_count((ask_twap - bid_twap) / vwap > 0)
+
+
+# Alpha3: Number of times capital inflow > capital outflow within 5 minutes
+@register_factor('alpha3', ['lift_volume', 'lift_vwap', 'hit_volume', 'hit_vwap'])
+def _alpha3(lift_volume, lift_vwap, hit_volume, hit_vwap):
+    capital_inflow = np.nansum(lift_volume * lift_vwap, axis=2)
+    capital_outflow = np.nansum(hit_volume * hit_vwap, axis=2)
+    return (capital_inflow > capital_outflow).astype(np.int64)
+
+
+# Alpha4: Number of times active buy volume > 5-minute rolling average within 5 minutes
+@register_factor('alpha4', ['lift_volume', 'avg_lift_volume_5min'])
+def _alpha4(lift_volume, avg_lift_volume_5min):
+    return _count(lift_volume > avg_lift_volume_5min)
+
+
+# Alpha5: Number of times active sell volume < 5-minute rolling average within 5 minutes
+@register_factor('alpha5', ['hit_volume', 'avg_hit_volume_5min'])
+def _alpha5(hit_volume, avg_hit_volume_5min):
+    return _count(hit_volume < avg_hit_volume_5min)
+
+
+# Alpha6: Number of times trade count > 5-minute rolling average within 5 minutes
+@register_factor('alpha6', ['num_trade', 'avg_num_trade_5min'])
+def _alpha6(num_trade, avg_num_trade_5min):
+    return -_count(num_trade > avg_num_trade_5min)
+
+
+# Alpha7: Price momentum within 5-minute intervals
+@register_factor('alpha7', ['close_pct_change'])
+def _alpha7(close_pct_change):
+    return -_count(close_pct_change > 0)
+
+
+# Alpha8: Volume imbalance in 5-minute intervals
+@register_factor('alpha8', ['volume_imbalance', 'lift_volume', 'hit_volume'])
+def _alpha8(volume_imbalance, lift_volume, hit_volume):
+    return _count(volume_imbalance / (lift_volume + hit_volume) > 0)
+
+
+# Alpha9: Price deviation from VWAP in 5-minute intervals
+@register_factor('alpha9', ['close', 'vwap'])
+def _alpha9(close, vwap):
+    return -_count((close - vwap) / vwap > 0)
+
+
+# Alpha10: Bid-ask spread relative to VWAP
+@register_factor('alpha10', ['last_ask', 'last_bid', 'vwap'])
+def _alpha10(last_ask, last_bid, vwap):
+    return -_count((last_ask - last_bid) / vwap > 0)
+
+
+# Alpha11: Spike in trade count
+@register_factor('alpha11', ['num_trade', 'avg_num_trade_5min'])
+def _alpha11(num_trade, avg_num_trade_5min):
+    return -_count(num_trade - avg_num_trade_5min > 0)
+
+
+def _registered_node(name):
+    """
+    Look up a registered intermediate or factor by name, or return None for a raw field.
+    """
+    return INTERMEDIATES.get(name, FACTOR_REGISTRY.get(name))
+
+
+def _evaluation_order(factors):
     """
+    Topologically sort the intermediates and factors needed for the selected factors.
+
+    :param factors: List of factor names
+    :return: A tuple (order, fields) with the intermediate/factor names in evaluation order and the raw fields needed.
+    """
+    order, fields, visited = [], [], set()
+
+    def visit(name):
+        if name in visited:
+            return
+        visited.add(name)
+        node = _registered_node(name)
+        if node is None:
+            fields.append(name)  # Anything that is not registered is a raw MMEP field
+            return
+        for input_name in node['inputs']:
+            visit(input_name)
+        order.append(name)
+
+    for factor in factors:
+        if factor not in FACTOR_REGISTRY:
+            raise KeyError(f"Unknown factor: {factor}")
+        visit(factor)
+    return order, fields
+
+
+def required_fields(factors=None):
+    """
+    List the raw MMEP fields needed to compute the selected factors.
+
+    :param factors: List of factor names (default: every registered factor)
+    :return: A list of field names, e.g. to pass to get_mmep_data or load_mmep_data_from_store.
+    """
+    factors = list(FACTOR_REGISTRY) if factors is None else list(factors)
+    return _evaluation_order(factors)[1]
+
+
+def _evaluate_factors(blocks, positions, index, stocks, factors, order, factor_dtype=np.int64):
+    """
+    Evaluate the factor DAG on reshaped field blocks.
+
+    :param blocks: Dictionary of field -> (days, buckets, 5, stocks) block, as returned by _five_minute_blocks
+    :param positions: The (day, bucket) position arrays of the buckets present in the data
+    :param index: The matching (didx, tidx // 5) MultiIndex
+    :param stocks: Stock column Index
+    :param factors: List of factor names to return
+    :param order: Intermediates and factors in evaluation order, as returned by _evaluation_order
+    :param factor_dtype: Integer dtype of the factor outputs
+    :return: A dictionary of factor name -> DataFrame indexed by (didx, tidx // 5).
+    """
+    day_pos, bucket_pos = positions
+
+    # Number of nodes still waiting for each value, so intermediates can be released once consumed
+    pending = {}
+    for name in order:
+        for input_name in _registered_node(name)['inputs']:
+            pending[input_name] = pending.get(input_name, 0) + 1
+
+    values = dict(blocks)
     alpha_results = {}
 
-    # Extract relevant data for all stocks (assuming multilevel columns in the DataFrame)
-    lift_volume = mmep_data.xs('lift_volume', level=0, axis=1)
-    hit_volume = mmep_data.xs('hit_volume', level=0, axis=1)
-    lift_vwap = mmep_data.xs('lift_vwap', level=0, axis=1)
-    hit_vwap = mmep_data.xs('hit_vwap', level=0, axis=1)
-    num_trade = mmep_data.xs('num_trade', level=0, axis=1)
-
-    # Group by 5-minute intervals (assuming tidx is the minute index)
-    grouped = mmep_data.groupby([mmep_data.index.get_level_values('didx'),
-                                 mmep_data.index.get_level_values('tidx') // 5])
-
-    # Alpha1: Number of times active buy volume > active sell volume within 5 minutes
-    alpha1 = (lift_volume - hit_volume).groupby(
-        [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
-    ).apply(lambda x: (x > 0).sum())
-    alpha1 = alpha1.reindex(grouped.size().index, fill_value=0)
-
-    # Alpha2: Bid-ask VWAP imbalance in 5-minute intervals
-    alpha2 = -((mmep_data.xs('ask_twap', level=0, axis=1) - mmep_data.xs('bid_twap', level=0, axis=1)) / mmep_data.xs('vwap', level=0, axis=1)).groupby(
-        [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
-    ).apply(lambda x: (x > 0).sum())
-    alpha2 = alpha2.reindex(grouped.size().index, fill_value=0)
-
-    # Alpha3: Number of times capital inflow > capital outflow within 5 minutes 
-    capital_inflow = (lift_volume * lift_vwap).groupby(
-        [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
-    ).sum()
-    capital_outflow = (hit_volume * hit_vwap).groupby(
-        [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
-    ).sum()
-    alpha3 = (capital_inflow > capital_outflow).astype(int)
-    alpha3 = alpha3.reindex(grouped.size().index, fill_value=0)
-
-    # Alpha4: Number of times active buy volume > 5-minute rolling average within 5 minutes  
-    avg_buy_volume_5min = lift_volume.rolling(window=5).mean()
-    alpha4 = (lift_volume > avg_buy_volume_5min).groupby(
-        [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
-    ).sum()
-    alpha4 = alpha4.reindex(grouped.size().index, fill_value=0)
-
-    # Alpha5: Number of times active sell volume <  5-minute rolling average within 5 minutes
-    avg_sell_volume_5min = hit_volume.rolling(window=5).mean()
-    alpha5 = (hit_volume < avg_sell_volume_5min).groupby(
-        [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
-    ).sum()
-    alpha5 = alpha5.reindex(grouped.size().index, fill_value=0)
-
-    #   
-    avg_num_trade_5min = num_trade.rolling(window=5).mean()
-    alpha6 = -(num_trade > avg_num_trade_5min).groupby(
-        [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
-    ).sum()
-    alpha6 = alpha6.reindex(grouped.size().index, fill_value=0)
-
-    # Alpha7: Price momentum within 5-minute intervals
-    alpha7 = -mmep_data.xs('close', level=0, axis=1).pct_change().groupby(
-        [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
-    ).apply(lambda x: (x > 0).sum())
-    alpha7 = alpha7.reindex(grouped.size().index, fill_value=0)
-
-    # Alpha8: Volume imbalance in 5-minute intervals
-    alpha8 = ((lift_volume - hit_volume) / (lift_volume + hit_volume)).groupby(
-        [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
-    ).apply(lambda x: (x > 0).sum())
-    alpha8 = alpha8.reindex(grouped.size().index, fill_value=0)
-
-    # Alpha9: Price deviation from VWAP in 5-minute intervals
-    alpha9 = -((mmep_data.xs('close', level=0, axis=1) - mmep_data.xs('vwap', level=0, axis=1)) / mmep_data.xs('vwap', level=0, axis=1)).groupby(
-        [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
-    ).apply(lambda x: (x > 0).sum())
-    alpha9 = alpha9.reindex(grouped.size().index, fill_value=0)
-
-    # Alpha10: Bid-ask spread relative to VWAP
-    alpha10 = -((mmep_data.xs('last_ask', level=0, axis=1) - mmep_data.xs('last_bid', level=0, axis=1)) / mmep_data.xs('vwap', level=0, axis=1)).groupby(
-        [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
-    ).apply(lambda x: (x > 0).sum())
-    alpha10 = alpha10.reindex(grouped.size().index, fill_value=0)
-
-    # Alpha11: Spike in trade count
-    alpha11 = -(num_trade - num_trade.rolling(window=5).mean()).groupby(
-        [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
-    ).apply(lambda x: (x > 0).sum())
-    alpha11 = alpha11.reindex(grouped.size().index, fill_value=0)
-
-    # Store all alpha results in a dictionary
-    alpha_results['alpha1'] = alpha1
-    alpha_results['alpha2'] = alpha2
-    alpha_results['alpha3'] = alpha3
-    alpha_results['alpha4'] = alpha4
-    alpha_results['alpha5'] = alpha5
-    alpha_results['alpha6'] = alpha6
-    alpha_results['alpha7'] = alpha7
-    alpha_results['alpha8'] = alpha8
-    alpha_results['alpha9'] = alpha9
-    alpha_results['alpha10'] = alpha10
-    alpha_results['alpha11'] = alpha11
+    # Divisions by zero volume or VWAP give inf/NaN, which never count towards a factor
+    with profile_stage('alpha_factors.factors', rows=len(index)), np.errstate(divide='ignore', invalid='ignore'):
+        for name in order:
+            node = _registered_node(name)
+            with profile_stage(f'alpha_factors.{name}', rows=len(index)):
+                result = node['func'](*(values[input_name] for input_name in node['inputs']))
+            for input_name in node['inputs']:
+                pending[input_name] -= 1
+                if pending[input_name] == 0:
+                    del values[input_name]
+
+            if name in factors:
+                # Keep only the buckets present in the data
+                alpha_results[name] = pd.DataFrame(result[day_pos, bucket_pos].astype(factor_dtype),
+                                                   index=index, columns=stocks)
+            if pending.get(name, 0) > 0:
+                values[name] = result
+
+    return {name: alpha_results[name] for name in factors}
+
+
+def calculate_five_minute_alpha_factors(mmep_data, factors=None, dates=None, factor_dtype=np.int64):
+    """
+    Calculate Alpha factors at 5-minute intervals for all stocks in the data.
+
+    The selected factors and the intermediates they declare are evaluated as a DAG: each field is reshaped once
+    into a dense (days, buckets, 5, stocks) block, every shared intermediate is computed once and released as soon
+    as no remaining factor needs it, and every factor is an array reduction along the minute axis. Rolling windows
+    and price changes are reset at day boundaries, so no factor looks across the overnight gap.
+
+    :param mmep_data: MMEP-format DataFrame with multi-index (didx, tidx), or the directory of a columnar MMEP
+                      store, from which only the fields the selected factors need are loaded.
+    :param factors: List of factor names to compute (default: every registered factor)
+    :param dates: List of dates to load when mmep_data is a store directory (default: all dates in the store)
+    :param factor_dtype: Integer dtype of the factor counts, e.g. COMPACT_FACTOR_DTYPE (int8) to go with a compact
+                         dtype schema of the inputs (see data_processing.compact_mmep_data)
+    :return: A dictionary of DataFrames containing different Alpha factors, indexed by (didx, tidx // 5).
+    """
+    factors = list(FACTOR_REGISTRY) if factors is None else list(factors)
+    order, fields = _evaluation_order(factors)
+    if isinstance(mmep_data, str):
+        mmep_data = load_mmep_data_from_store(mmep_data, fields, dates)
+    with profile_stage('alpha_factors.reshape', rows=len(mmep_data)):
+        blocks, positions, index, stocks = _five_minute_blocks(mmep_data, fields)
+
+    return _evaluate_factors(blocks, positions, index, stocks, factors, order, factor_dtype)
+
+
+def _factor_key(name, date, input_fingerprints):
+    """
+    Cache key of one factor on one date: the factor version and name plus the fingerprints of the date's inputs.
+    """
+    digest = hashlib.blake2b(f'{FACTOR_VERSION}|{name}|{date}'.encode(), digest_size=16)
+    for fingerprint in input_fingerprints:
+        digest.update(f'|{fingerprint}'.encode())
+    return digest.hexdigest()
+
+
+def _frame_fingerprints(mmep_data, fields):
+    """
+    Fingerprint every date and every (field, date) of an MMEP DataFrame from cheap row checksums.
+
+    :return: A tuple (stocks, date_fingerprints, field_fingerprints) where field_fingerprints maps field ->
+             {date -> fingerprint}.
+    """
+    stocks = mmep_data.columns.get_level_values(1).unique()
+    tidx = np.asarray(mmep_data.index.get_level_values('tidx'))
+    day_rows = mmep_data.groupby(level='didx').indices
+    date_fingerprints = {date: fingerprint_arrays(stocks, tidx[rows]) for date, rows in day_rows.items()}
+
+    field_fingerprints = {}
+    for field in fields:
+        values = _field_values(mmep_data, field, stocks)
+        checksums = row_checksums(values)
+        field_fingerprints[field] = {date: f'{values.dtype.str}{fingerprint_arrays(checksums[rows])}'
+                                     for date, rows in day_rows.items()}
+    return stocks, date_fingerprints, field_fingerprints
+
 
+def _store_fingerprints(store_dir, fields, dates):
+    """
+    Fingerprint every date and every (field, date) of a columnar MMEP store from its array file signatures.
+
+    :return: A tuple (stocks, date_fingerprints, field_fingerprints) like _frame_fingerprints.
+    """
+    meta, signatures = mmep_store_signatures(store_dir, fields, dates)
+    dates = sorted({date for field_signatures in signatures.values() for date in field_signatures},
+                   key=list(meta['dates']).index)
+    n_stocks = max((meta['dates'][date]['n_stocks'] for date in dates), default=0)
+    stocks = pd.Index(meta['stocks'][:n_stocks])
+    date_fingerprints = {date: fingerprint_arrays(meta['stocks'][:meta['dates'][date]['n_stocks']])
+                         for date in dates}
+    field_fingerprints = {field: {date: f"{signature['size']}:{signature['mtime_ns']}"
+                                  for date, signature in field_signatures.items()}
+                          for field, field_signatures in signatures.items()}
+    return stocks, date_fingerprints, field_fingerprints
+
+
+def calculate_five_minute_alpha_factors_cached(mmep_data, cache, factors=None, dates=None, factor_dtype=np.int64):
+    """
+    Calculate the 5-minute Alpha factors, reusing per-date results from a FactorCache.
+
+    Every factor only depends on a single day's bars, so results are cached per date and factor, keyed by
+    FACTOR_VERSION and a fingerprint of the date's input fields. For a columnar store the fingerprint is built from
+    the signatures (size and mtime) of the store's arrays, so a fully warm run reads no market data at all; for a
+    DataFrame it is built from cheap row checksums of the fields. Only the dates with a missing entry are computed.
+
+    :param mmep_data: MMEP-format DataFrame with multi-index (didx, tidx), or the directory of a columnar MMEP store
+    :param cache: A factor_cache.FactorCache
+    :param factors: List of factor names to compute (default: every registered factor)
+    :param dates: List of dates to use when mmep_data is a store directory (default: all dates in the store)
+    :param factor_dtype: Integer dtype of the factor counts (see calculate_five_minute_alpha_factors)
+    :return: A dictionary of DataFrames containing different Alpha factors, indexed by (didx, tidx // 5).
+    """
+    factors = list(FACTOR_REGISTRY) if factors is None else list(factors)
+    fields = required_fields(factors)
+    if isinstance(mmep_data, str):
+        stocks, date_fingerprints, field_fingerprints = _store_fingerprints(mmep_data, fields, dates)
+    else:
+        stocks, date_fingerprints, field_fingerprints = _frame_fingerprints(mmep_data, fields)
+
+    # Look up every date once, and collect the dates that have factors to compute. Each factor is keyed on its own
+    # input fields only, so an entry does not depend on which other factors were requested with it
+    factor_fields = {name: required_fields([name]) for name in factors}
+    per_date, keys, missing = {}, {}, []
+    for date in sorted(date_fingerprints):
+        keys[date] = {name: _factor_key(name, date, [date_fingerprints[date]] + [
+            field_fingerprints[field].get(date) for field in factor_fields[name]]) for name in factors}
+        per_date[date] = cache.get(date, keys[date])
+        if len(per_date[date]) < len(factors):
+            missing.append(date)
+
+    if missing:
+        if isinstance(mmep_data, str):
+            computed = calculate_five_minute_alpha_factors(mmep_data, factors, missing, factor_dtype)
+        else:
+            day_rows = mmep_data.groupby(level='didx').indices
+            rows = np.sort(np.concatenate([day_rows[date] for date in missing]))
+            computed = calculate_five_minute_alpha_factors(mmep_data.iloc[rows], factors, factor_dtype=factor_dtype)
+        first = next(iter(computed.values()))
+        computed_buckets = np.asarray(first.index.get_level_values('tidx'))
+        computed_values = {name: alpha_df.to_numpy() for name, alpha_df in computed.items()}
+        for date, rows in first.groupby(level='didx').indices.items():
+            results = {name: (computed_buckets[rows], first.columns, values[rows])
+                       for name, values in computed_values.items()}
+            per_date[date].update(results)
+            cache.put(date, keys[date], results)
+    cache.save()
+
+    # Assemble the per-date results; stocks missing from a date's result have no bars, so their counts are 0
+    dates = sorted(per_date)
+    alpha_results = {}
+    for name in factors:
+        blocks, buckets = [], []
+        for date in dates:
+            date_buckets, date_stocks, values = per_date[date][name]
+            values = values.astype(factor_dtype, copy=False)
+            if not date_stocks.equals(stocks):
+                positions = stocks.get_indexer(date_stocks)
+                aligned = np.zeros((len(values), len(stocks)), dtype=factor_dtype)
+                aligned[:, positions[positions >= 0]] = values[:, positions >= 0]
+                values = aligned
+            blocks.append(values)
+            buckets.append(date_buckets)
+        didx = pd.Index(dates).repeat([len(date_buckets) for date_buckets in buckets])
+        index = pd.MultiIndex.from_arrays([didx, np.concatenate(buckets) if buckets else []], names=['didx', 'tidx'])
+        values = np.concatenate(blocks) if blocks else np.zeros((0, len(stocks)), dtype=factor_dtype)
+        alpha_results[name] = pd.DataFrame(values, index=index, columns=stocks)
     return alpha_results
 
 
-def opPower(alpha_series):
+# Shared panel attached by the worker processes of calculate_five_minute_alpha_factors_parallel
+_shared_panel = {}
+
+
+def _attach_shared_panel(spec):
+    _shared_panel['panel'] = SharedMMEPPanel.attach(spec)
+
+
+def _shared_panel_factors(factors, stock_slice, factor_dtype):
     """
-    Apply the opPower transformation on the alpha factor series:
-    
-    1. Rank the alpha values, transforming them into a range of [-0.5, 0.5].
-    2. Apply an exponential transformation to the absolute values while keeping the original signs.
-    3. Scale the positive and negative portions separately such that:
-       - The positive part sums to +0.5.
-       - The negative part sums to -0.5.
-    
-    :param alpha_series: A pandas Series representing the alpha factor for a cross-section (e.g., across multiple stocks).
-    :return: A transformed pandas Series where the positive and negative parts sum to +0.5 and -0.5, respectively.
+    Compute factors on a block of stocks of the attached shared panel (executed in a worker process).
     """
-    
-    # Step 1: Rank alpha values and transform to the range [-0.5, 0.5]
-    ranked_alpha = alpha_series.rank(pct=True) - 0.5
-    
-    # Step 2: Apply the exponential transformation to the absolute values while preserving the signs
-    transformed_alpha = ranked_alpha.apply(lambda x: np.sign(x) * np.exp(np.abs(x)))
-    
-    # Step 3: Scale the positive and negative parts separately
-    positive_sum = transformed_alpha[transformed_alpha > 0].sum()
-    negative_sum = transformed_alpha[transformed_alpha < 0].sum()
-    
-    if positive_sum != 0:
-        # Scale positive values to ensure their sum is 0.5
-        transformed_alpha[transformed_alpha > 0] *= 0.5 / positive_sum
-    if negative_sum != 0:
-        # Scale negative values to ensure their sum is -0.5
-        transformed_alpha[transformed_alpha < 0] *= 0.5 / abs(negative_sum)
-    
-    return transformed_alpha
+    panel = _shared_panel['panel']
+    order, fields = _evaluation_order(factors)
+    didx = np.asarray(panel.spec['days'], dtype=object)[panel.spec['day_codes']]
+    with profile_stage('alpha_factors.reshape', rows=len(didx)):
+        blocks, positions, index, stocks = _five_minute_blocks_from_arrays(
+            lambda field: panel.field_values(field, stock_slice), fields, didx, panel.spec['tidx'],
+            panel.stocks[stock_slice])
+    return _evaluate_factors(blocks, positions, index, stocks, factors, order, factor_dtype)
 
-def calculate_and_transform_position(mmep_data):
+
+def calculate_five_minute_alpha_factors_parallel(mmep_data, factors=None, n_jobs=None, split='factor',
+                                                 factor_dtype=np.int64):
+    """
+    Calculate the 5-minute Alpha factors in worker processes attached to one shared-memory copy of the panel.
+
+    The workers read the fields straight from shared memory (see data_processing.SharedMMEPPanel), so the panel
+    is neither pickled nor copied per worker; only the factor results are sent back.
+
+    :param mmep_data: MMEP-format DataFrame with multi-index (didx, tidx), or a SharedMMEPPanel. A DataFrame is
+                      copied into shared memory (only the fields the selected factors need) for the duration of
+                      the call.
+    :param factors: List of factor names to compute (default: every registered factor)
+    :param n_jobs: Number of worker processes (None uses os.cpu_count())
+    :param split: 'factor' to give every worker a group of factors on all stocks (intermediates shared by
+                  factors of different groups are computed in each of them), or 'stock' to give every worker all
+                  factors on a block of stocks
+    :param factor_dtype: Integer dtype of the factor counts (see calculate_five_minute_alpha_factors)
+    :return: A dictionary of DataFrames containing different Alpha factors, indexed by (didx, tidx // 5); equal to
+             the result of calculate_five_minute_alpha_factors.
+    """
+    factors = list(FACTOR_REGISTRY) if factors is None else list(factors)
+    if isinstance(mmep_data, SharedMMEPPanel):
+        panel = mmep_data
+    else:
+        panel = SharedMMEPPanel.create(mmep_data, required_fields(factors))
+
+    try:
+        n_jobs = n_jobs or os.cpu_count() or 1
+        if split == 'factor':
+            groups = np.array_split(np.arange(len(factors)), min(n_jobs, len(factors)))
+            tasks = [([factors[i] for i in group], slice(None), factor_dtype) for group in groups]
+        elif split == 'stock':
+            bounds = np.linspace(0, len(panel.stocks), min(n_jobs, len(panel.stocks)) + 1).astype(int)
+            tasks = [(factors, slice(start, stop), factor_dtype) for start, stop in zip(bounds[:-1], bounds[1:])]
+        else:
+            raise ValueError(f"Unknown split: {split}")
+
+        with profile_stage('alpha_factors.parallel', rows=panel.spec['shape'][1]):
+            with ProcessPoolExecutor(max_workers=len(tasks), initializer=_attach_shared_panel,
+                                     initargs=(panel.spec,)) as executor:
+                results = list(executor.map(_shared_panel_factors, *zip(*tasks)))
+    finally:
+        if panel is not mmep_data:
+            panel.unlink()
+
+    if split == 'factor':
+        return {name: alpha_df for result in results for name, alpha_df in result.items()}
+    return {name: pd.concat([result[name] for result in results], axis=1) for name in factors}
+
+
+def calculate_and_transform_position(mmep_data, cache=None, factors=None, factor_dtype=np.int64):
     """
     Calculate and transform the target positions using Alpha factors.
     
@@ -154,33 +565,232 @@ def calculate_and_transform_position(mmep_data):
     positions, which are also passed through the opPower function to ensure they are balanced.
     
     :param mmep_data: A pandas DataFrame in MMEP format, containing the necessary input data for all stocks.
+    :param cache: Optional factor_cache.FactorCache from which unchanged per-date factor results are reused.
+    :param factors: List of factor names to combine (default: every registered factor).
+    :param factor_dtype: Integer dtype of the factor counts, e.g. COMPACT_FACTOR_DTYPE (int8) to keep a compact
+                         dtype schema through the factors (see calculate_five_minute_alpha_factors).
     :return: A pandas DataFrame representing the final transformed target positions for each stock at each time step.
     """
     # Step 1: Calculate Alpha factors based on the MMEP data
-    alphas_dict = calculate_five_minute_alpha_factors(mmep_data)
-    
-    # Dictionary to hold the transformed Alpha factors
-    alphas_transformed = {}
+    if cache is None:
+        alphas_dict = calculate_five_minute_alpha_factors(mmep_data, factors, factor_dtype=factor_dtype)
+    else:
+        alphas_dict = calculate_five_minute_alpha_factors_cached(mmep_data, cache, factors, factor_dtype=factor_dtype)
 
-    # Step 2: Process each Alpha factor DataFrame
+    # Step 2: Transform every cross-section of each Alpha factor at once with opPower
+    alphas_transformed = {}
     for name, alpha_df in alphas_dict.items():
-        # Create a DataFrame to hold the transformed alphas (same structure as original alpha_df)
-        transformed_alpha = pd.DataFrame(index=alpha_df.index, columns=alpha_df.columns)
-
-        # Apply opPower function to each cross-section
-        for time_idx in alpha_df.index:
-            cross_section = alpha_df.loc[time_idx]  # Extract cross-section for this time
-            transformed_alpha.loc[time_idx] = opPower(cross_section)  # Apply opPower transformation
-
-        # Store the transformed alpha in the dictionary
-        alphas_transformed[name] = transformed_alpha
+        with profile_stage(f'alpha_factors.opPower.{name}', rows=len(alpha_df)):
+            alphas_transformed[name] = opPower(alpha_df)
 
     # Step 3: Combine all the processed Alpha factors into a single signal DataFrame
     # Here, summing the Alpha factors creates the combined signal
     combined_signal = sum(alphas_transformed.values())
 
     # Step 4: Apply the opPower transformation to the combined signal for the final position assignment
-    position = combined_signal.apply(opPower, axis=1)  # Transform across each time point
+    with profile_stage('alpha_factors.opPower.combined', rows=len(combined_signal)):
+        position = opPower(combined_signal)  # Transform across each time point
 
     # Return the final positions
     return position
+
+
+class StreamingPositionEngine:
+    """
+    Streaming counterpart to calculate_and_transform_position that consumes one minute bar at a time.
+
+    Only O(1) state per stock is kept: the last four minutes of lift_volume, hit_volume and num_trade for the
+    rolling means, the last (forward-filled) close for the price change, and the running counters of the current
+    5-minute bucket. All state is reset at the start of a new day, like the batch factors. When a bucket closes, the
+    opPower-combined target position is emitted; on replayed history it equals the batch result row for row.
+
+    The engine implements the factors and intermediates listed in FACTORS and INTERMEDIATES bar by bar, so it
+    refuses to run when the registry holds anything else (see check_registry).
+    """
+
+    # Registered factor functions mirrored by the engine, in the order of its counters, with the sign they apply
+    FACTORS = {'alpha1': (_alpha1, 1), 'alpha2': (_alpha2, -1), 'alpha3': (_alpha3, 1), 'alpha4': (_alpha4, 1),
+               'alpha5': (_alpha5, 1), 'alpha6': (_alpha6, -1), 'alpha7': (_alpha7, -1), 'alpha8': (_alpha8, 1),
+               'alpha9': (_alpha9, -1), 'alpha10': (_alpha10, -1), 'alpha11': (_alpha11, -1)}
+    INTERMEDIATES = {'volume_imbalance': _volume_imbalance, 'avg_lift_volume_5min': _avg_lift_volume_5min,
+                     'avg_hit_volume_5min': _avg_hit_volume_5min, 'avg_num_trade_5min': _avg_num_trade_5min,
+                     'close_pct_change': _close_pct_change}
+
+    def __init__(self, stocks):
+        """
+        :param stocks: The stock columns of the incoming bars (and of the emitted positions).
+        """
+        self.check_registry()
+        self.fields = required_fields(list(self.FACTORS))
+        self.stocks = pd.Index(stocks)
+        self.didx = None
+        self.bucket = None
+        self._reset_day()
+
+    @classmethod
+    def check_registry(cls):
+        """
+        Raise a ValueError if the factor registry differs from what the engine implements, since its positions would
+        then no longer match calculate_and_transform_position.
+        """
+        order, _ = _evaluation_order([name for name in cls.FACTORS if name in FACTOR_REGISTRY])
+        implemented = {**{name: func for name, (func, _) in cls.FACTORS.items()}, **cls.INTERMEDIATES}
+        registered = {name: node['func'] for name, node in FACTOR_REGISTRY.items()}
+        registered.update({name: INTERMEDIATES[name]['func'] for name in order if name in INTERMEDIATES})
+        differing = sorted(name for name in implemented.keys() | registered.keys()
+                           if implemented.get(name) is not registered.get(name))
+        if differing:
+            raise ValueError(f"StreamingPositionEngine does not implement the registered definition of: "
+                             f"{', '.join(differing)}")
+
+    def _reset_day(self):
+        n_stocks = len(self.stocks)
+        self.last_tidx = None
+        # Previous four minutes (oldest first) of the fields with rolling means
+        self.history = {field: np.full((4, n_stocks), np.nan) for field in ['lift_volume', 'hit_volume', 'num_trade']}
+        self.last_close = np.full(n_stocks, np.nan)
+        self._reset_bucket()
+
+    def _reset_bucket(self):
+        n_stocks = len(self.stocks)
+        self.counts = np.zeros((len(self.FACTORS), n_stocks), dtype=np.int64)
+        self.capital_inflow = np.zeros(n_stocks)
+        self.capital_outflow = np.zeros(n_stocks)
+
+    def _rolling_mean(self, field, value):
+        """
+        Trailing 5-minute mean of a field including the current minute, then push the minute into the history.
+        """
+        x = self.history[field]
+        mean = ((((x[0] + x[1]) + x[2]) + x[3]) + value) / 5
+        x[:-1] = x[1:]
+        x[-1] = value
+        return mean
+
+    def _skip_minutes(self, n_minutes):
+        """
+        Push missing minutes (gaps in tidx) into the rolling history as NaN.
+        """
+        for x in self.history.values():
+            n = min(n_minutes, len(x))
+            x[:-n] = x[n:]
+            x[-n:] = np.nan
+
+    def _emit(self):
+        """
+        Close the current bucket and return its target position, or None if no bar has been seen.
+        """
+        if self.bucket is None:
+            return None
+        signs = np.array([sign for _, sign in self.FACTORS.values()])
+        alphas = self.counts * signs[:, None]
+        alphas[list(self.FACTORS).index('alpha3')] = self.capital_inflow > self.capital_outflow
+
+        # Transform every alpha cross-section, combine them and transform the combined signal
+        transformed = opPower(pd.DataFrame(alphas.astype(np.float64))).to_numpy()
+        combined_signal = sum(transformed[i] for i in range(len(self.FACTORS)))
+        position = opPower(pd.Series(combined_signal, index=self.stocks, name=(self.didx, self.bucket)))
+
+        self.bucket = None
+        self._reset_bucket()
+        return position
+
+    def update_arrays(self, didx, tidx, values):
+        """
+        Process one minute bar given as a dictionary of field -> float array aligned with the stocks.
+
+        :param didx: Date of the bar
+        :param tidx: Minute index of the bar within the day
+        :param values: Dictionary of field name -> 1-D float array over the stocks
+        :return: A list of the positions (pandas Series named (didx, bucket)) of the buckets closed by this bar.
+        """
+        emitted = []
+        bucket = tidx // BUCKET_MINUTES
+        if didx != self.didx or bucket != self.bucket:
+            position = self._emit()
+            if position is not None:
+                emitted.append(position)
+        if didx != self.didx:
+            self.didx = didx
+            self._reset_day()
+        elif self.last_tidx is not None and tidx > self.last_tidx + 1:
+            self._skip_minutes(tidx - self.last_tidx - 1)
+        self.bucket = bucket
+        self.last_tidx = tidx
+
+        lift_volume, hit_volume = values['lift_volume'], values['hit_volume']
+        num_trade, vwap, close = values['num_trade'], values['vwap'], values['close']
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Price change against the last known close of the day
+            filled_close = np.where(np.isnan(close), self.last_close, close)
+            pct_change = filled_close / self.last_close - 1
+            self.last_close = filled_close
+
+            avg_num_trade_5min = self._rolling_mean('num_trade', num_trade)
+            conditions = [
+                lift_volume - hit_volume > 0,
+                (values['ask_twap'] - values['bid_twap']) / vwap > 0,
+                np.zeros(len(self.stocks), dtype=bool),  # alpha3 compares the bucket's capital flows on close
+                lift_volume > self._rolling_mean('lift_volume', lift_volume),
+                hit_volume < self._rolling_mean('hit_volume', hit_volume),
+                num_trade > avg_num_trade_5min,
+                pct_change > 0,
+                (lift_volume - hit_volume) / (lift_volume + hit_volume) > 0,
+                (close - vwap) / vwap > 0,
+                (values['last_ask'] - values['last_bid']) / vwap > 0,
+                num_trade - avg_num_trade_5min > 0
+            ]
+            self.counts += np.array(conditions)
+            self.capital_inflow += np.nan_to_num(lift_volume * values['lift_vwap'])
+            self.capital_outflow += np.nan_to_num(hit_volume * values['hit_vwap'])
+
+        # The bucket is complete after its last minute
+        if tidx % BUCKET_MINUTES == BUCKET_MINUTES - 1:
+            emitted.append(self._emit())
+        return emitted
+
+    def update(self, didx, tidx, bar):
+        """
+        Process one minute bar for all stocks.
+
+        :param didx: Date of the bar
+        :param tidx: Minute index of the bar within the day
+        :param bar: One row of an MMEP DataFrame (a pandas Series indexed by (field, stock)), or a dictionary of
+                    field name -> pandas Series indexed by stock.
+        :return: A list of the positions (pandas Series named (didx, bucket)) of the buckets closed by this bar.
+        """
+        values = {field: pd.Series(bar[field]).reindex(self.stocks).to_numpy(dtype=np.float64, na_value=np.nan)
+                  for field in self.fields}
+        return self.update_arrays(didx, tidx, values)
+
+    def flush(self):
+        """
+        Close the current (possibly partial) bucket, e.g. at the end of the day.
+
+        :return: The position of the closed bucket, or None if there was no open bucket.
+        """
+        return self._emit()
+
+
+def replay_streaming_positions(mmep_data):
+    """
+    Replay an MMEP DataFrame bar by bar through a StreamingPositionEngine and collect the emitted positions.
+
+    :param mmep_data: MMEP-format DataFrame with multi-index (didx, tidx)
+    :return: A pandas DataFrame of target positions indexed by (didx, tidx // 5), like calculate_and_transform_position.
+    """
+    stocks = mmep_data.columns.get_level_values(1).unique()
+    engine = StreamingPositionEngine(stocks)
+    fields = {field: mmep_data.xs(field, level=0, axis=1).reindex(columns=stocks)
+              .to_numpy(dtype=np.float64, na_value=np.nan) for field in engine.fields}
+
+    positions = []
+    for row, (didx, tidx) in enumerate(mmep_data.index):
+        positions.extend(engine.update_arrays(didx, tidx, {field: values[row] for field, values in fields.items()}))
+    position = engine.flush()
+    if position is not None:
+        positions.append(position)
+
+    index = pd.MultiIndex.from_tuples([position.name for position in positions], names=['didx', 'tidx'])
+    return pd.DataFrame([position.to_numpy() for position in positions], index=index, columns=stocks)
@@ -1,6 +1,18 @@
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 
+from profiling import profile_stage
+from pnl_metrics import summarize_capital_paths, new_running_metrics, update_running_metrics
+from cost_models import as_cost_model
+
+
+CHECKPOINT_VERSION = 1
+PNL_COLUMNS = ['Date', 'Capital', 'Return', 'Turnover', 'Long', 'Short']
+
+
 def calculate_five_minute_vwap(mmep_data):
     """
     Calculate the 5-minute VWAP (Volume Weighted Average Price) from minute-level data.
@@ -12,14 +24,29 @@ def calculate_five_minute_vwap(mmep_data):
     :return: A pandas Series containing the 5-minute VWAP values.
     """
     # Group data by date ('didx') and 5-minute intervals (grouping 'tidx' into chunks of 5 minutes)
-    grouped = mmep_data.groupby(['didx', mmep_data.index.get_level_values('tidx') // 5])
-    
-    # Calculate the 5-minute VWAP by applying a weighted sum of vwap * volume, divided by the total volume
-    vwap_5min = grouped.apply(lambda x: (x['vwap'] * x['volume']).sum() / x['volume'].sum())
-    
-    # Return the result as a pandas Series
+    keys = [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
+    # Compact (float32 / nullable integer) fields are weighted in float64, with missing values as NaN
+    vwap = mmep_data.xs('vwap', level=0, axis=1).astype(np.float64)
+    volume = mmep_data.xs('volume', level=0, axis=1).astype(np.float64)
+
+    # Calculate the 5-minute VWAP as the weighted sum of vwap * volume, divided by the total volume
+    with profile_stage('backtest.vwap_5min', rows=len(mmep_data)):
+        vwap_5min = (vwap * volume).groupby(keys).sum() / volume.groupby(keys).sum()
+
+    # Return the result as a pandas DataFrame (one column per stock)
     return vwap_5min
 
+def calculate_five_minute_volume(mmep_data):
+    """
+    Calculate the traded volume of every 5-minute interval from minute-level data (used by volume-aware cost models).
+
+    :param mmep_data: A pandas DataFrame in MMEP format, containing a 'volume' column.
+    :return: A pandas DataFrame of 5-minute volumes (one column per stock), indexed like calculate_five_minute_vwap.
+    """
+    keys = [mmep_data.index.get_level_values('didx'), mmep_data.index.get_level_values('tidx') // 5]
+    volume = mmep_data.xs('volume', level=0, axis=1).astype(np.float64)
+    return volume.groupby(keys).sum()
+
 def calculate_transaction_costs(trade_value, position_type='buy'):
     """
     Calculate transaction costs in the Hong Kong market, including stamp duty, trading fees, SFC levy, and slippage.
@@ -44,69 +71,378 @@ def calculate_transaction_costs(trade_value, position_type='buy'):
     
     return total_cost
 
-def backtest_vwap_strategy(mmep_data, position, initial_capital=1e7):
-    
-    capital = initial_capital
-    pnl_data = []  # Store pnl data (time, capital, return, turnover, long/short averages)
-    
-    # Calculate VWAP for every five minutes, handle NaN beforehand
-    vwap_5min = calculate_five_minute_vwap(mmep_data).fillna(method='ffill')
+def _forward_fill(values):
+    """
+    Forward fill NaN values along the first axis of a 2-D array.
+    """
+    positions = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(positions, axis=0, out=positions)
+    return np.take_along_axis(values, positions, axis=0)
+
+def _backtest_arrays(target, vwap, capital, previous_held, cost_models, stocks=None, volume=None):
+    """
+    Batched backtest core over N candidate position matrices and C cost scenarios.
+
+    :param target: Array (N, T, S) of target positions; row 0 is a warm-up row that is never evaluated itself.
+    :param vwap: Array (T, S) of forward-filled 5-minute VWAPs aligned with target.
+    :param capital: Capital before the first evaluated interval (scalar or broadcastable to (C, N)).
+    :param previous_held: Array (N, S) of positions held before the first evaluated interval.
+    :param cost_models: List of C cost models (see cost_models.CostModel), or functions mapping turnover to
+                        transaction costs as a fraction of capital, like calculate_transaction_costs.
+    :param stocks: Stock labels of the S columns (needed by per-stock cost models)
+    :param volume: Array (T, S) of 5-minute volumes aligned with target (needed by volume-aware cost models)
+    :return: A dictionary with the evaluated interval 'rows' (R,), 'ret', 'turnover', 'long' and 'short' (N, R),
+             the 'capital' paths (C, N, R) and the 'held' positions after the last interval (N, S).
+    """
+    n_candidates, _, n_stocks = target.shape
+    held = np.concatenate([np.full((n_candidates, 1, n_stocks), np.nan), target[:, :-1]], axis=1)
+
+    # Keep the intervals where the VWAP of every stock is known at both ends
+    known = ~np.isnan(vwap).any(axis=1)
+    rows = np.flatnonzero(known[1:] & known[:-1]) + 1
+
+    # Position before and after each evaluated interval's trade
+    new_position = held[:, rows]
+    previous_position = np.concatenate([previous_held[:, None, :], new_position[:, :-1]], axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Calculate returns using previous position and previous VWAP (computed once for all candidates)
+        vwap_return = vwap[rows] / vwap[rows - 1] - 1
+        ret = np.nansum(previous_position * vwap_return, axis=2)
+
+        # Turnover from the position change, and transaction costs as a fraction of the capital before the trade
+        trades = new_position - previous_position
+        turnover = np.nansum(np.abs(trades), axis=2)
+        context = {'stocks': stocks, 'vwap': vwap[rows], 'volume': None if volume is None else volume[rows]}
+
+        # Compound the capital over the intervals; capital-dependent costs are charged one interval at a time
+        capital = np.broadcast_to(capital, (len(cost_models), n_candidates))
+        capital_path = np.empty((len(cost_models), n_candidates, len(rows)))
+        for c, cost_model in enumerate(map(as_cost_model, cost_models)):
+            if not cost_model.capital_dependent:
+                cost = cost_model.cost(trades, context)
+                capital_path[c] = capital[c][:, None] * np.cumprod(1 + ret - cost, axis=1)
+                continue
+            current = capital[c]
+            for r in range(len(rows)):
+                step = {'stocks': stocks, 'capital': current[:, None], 'vwap': context['vwap'][r:r + 1],
+                        'volume': None if volume is None else context['volume'][r:r + 1]}
+                current = current * (1 + ret[:, r] - cost_model.cost(trades[:, r:r + 1], step)[:, 0])
+                capital_path[c, :, r] = current
+
+        # Average of long and short positions for each interval
+        is_long, is_short = new_position > 0, new_position < 0
+        long_position = np.where(is_long, new_position, 0).sum(axis=2) / is_long.sum(axis=2)
+        short_position = np.where(is_short, new_position, 0).sum(axis=2) / is_short.sum(axis=2)
+    long_position = np.round(np.where(is_long.any(axis=2), long_position, 0), 2)
+    short_position = np.round(np.where(is_short.any(axis=2), short_position, 0), 2)
+
+    return {
+        'rows': rows,
+        'ret': ret,
+        'turnover': turnover,
+        'capital': capital_path,
+        'long': long_position,
+        'short': short_position,
+        'held': new_position[:, -1] if len(rows) else previous_held
+    }
+
+def _interval_labels(labels):
+    """
+    Format (didx, tidx) interval labels as the 'mmdd-bb' strings used in the Date column of the PnL data.
+    """
+    return [f"{didx}-{tidx:02d}" for didx, tidx in zip(labels.get_level_values('didx'),
+                                                       labels.get_level_values('tidx'))]
+
+def run_vwap_backtest(position, vwap_5min, initial_capital=1e7, state=None, cost_model=None, volume_5min=None):
+    """
+    Backtest target positions against 5-minute VWAPs with whole-matrix operations.
+
+    The position decided at interval t is held from t + 1, earning the VWAP return from t to t + 1. Intervals where
+    either VWAP has a missing stock are skipped (the held position then carries over), and transaction costs are
+    charged on the absolute position change times the capital before the trade.
+
+    :param position: A pandas DataFrame of target positions (time x stock), indexed by (didx, tidx).
+    :param vwap_5min: A pandas DataFrame of 5-minute VWAPs, as returned by calculate_five_minute_vwap.
+    :param initial_capital: Starting capital, used when no state is given.
+    :param state: Terminal state of a previous run over the preceding intervals (see the return value). When given,
+                  the first interval is evaluated against that state instead of being used as a warm-up row.
+    :param cost_model: A cost_models.CostModel, or a function mapping turnover to transaction costs as a fraction of
+                       capital (default: calculate_transaction_costs).
+    :param volume_5min: A pandas DataFrame of 5-minute volumes, as returned by calculate_five_minute_volume
+                        (required by volume-aware cost models).
+    :return: A tuple (pnl_df, state). pnl_df has the columns Date, Capital, Return, Turnover, Long and Short;
+             state is a dictionary with the final 'capital' and the last 'target' and 'held' positions and 'vwap'
+             (pandas Series indexed by stock), from which a later run can continue.
+    """
     stocks = position.columns
-    position = position.shift(1)
-    previous_position = position.iloc[0]  # Track the previous position for PnL and costs
-    previous_capital = capital
-
-    for idx in range(1, len(position)):  # Iterate over every five-minute interval (start from the second interval)
-        didx = position.index.get_level_values('didx')[idx]
-        tidx = position.index.get_level_values('tidx')[idx]
-
-        new_position = position.iloc[idx]
-        current_vwap = vwap_5min.iloc[idx - 1]  # VWAP at the previous interval
-        next_vwap = vwap_5min.iloc[idx]  # VWAP at the current interval
-
-        if pd.isna(current_vwap).any() or pd.isna(next_vwap).any():
-            continue  # Skip if there are NaN values in VWAP
-
-        # Calculate return
-        ret = next_vwap / current_vwap - 1
-        ret = np.sum(previous_position * ret)  # Calculate returns using previous position and previous VWAP
-        
-        # Calculate new capital
-        new_capital = previous_capital * (1 + ret)
-
-        # Calculate transaction costs: the change in position from the previous one
-        position_change = abs(new_position - previous_position)  # Change in position (absolute value)
-       
-        # Total transaction costs
-        total_cost = np.sum(calculate_transaction_costs(position_change * previous_capital))  # Total transaction cost
-        new_capital -= total_cost  # Subtract transaction cost from new capital
-
-        # Store turnover: position change * previous capital
-        turnover = np.sum(position_change)
-        
-        # Store the average of long and short positions for this interval
-        long_position = round(new_position[new_position > 0].mean() if len(new_position[new_position > 0]) > 0 else 0, 2)
-        short_position = round(new_position[new_position < 0].mean() if len(new_position[new_position < 0]) > 0 else 0, 2)
-
-        # Store time, capital, return, turnover, long position, and short position in pnl_data
-        pnl_data.append({
-            'Date': f"{didx}-{tidx:02d}",
-            'Capital': new_capital,
-            'Return': ret,
-            'Turnover': turnover,
-            'Long': long_position,
-            'Short': short_position
-        })
-
-        # Update the previous position and capital for the next loop
-        previous_position = new_position
-
-    # Create a DataFrame for pnl data
-    pnl_df = pd.DataFrame(pnl_data)
+    target = position.to_numpy(dtype=np.float64, na_value=np.nan)
+    vwap = vwap_5min.reindex(index=position.index, columns=stocks).to_numpy(dtype=np.float64)
+    volume = None
+    if volume_5min is not None:
+        volume = volume_5min.reindex(index=position.index, columns=stocks).to_numpy(dtype=np.float64)
+    labels = position.index
+
+    if state is None:
+        capital = initial_capital
+        previous_held = np.full(len(stocks), np.nan)  # Nothing is held before the first interval
+        labels = labels[1:]
+    else:
+        # Prepend the previous run's last interval so that the first new interval can be evaluated
+        capital = state['capital']
+        previous_held = state['held'].reindex(stocks).to_numpy(dtype=np.float64)
+        target = np.vstack([state['target'].reindex(stocks).to_numpy(dtype=np.float64), target])
+        vwap = np.vstack([state['vwap'].reindex(stocks).to_numpy(dtype=np.float64), vwap])
+        if volume is not None:
+            volume = np.vstack([np.full(len(stocks), np.nan), volume])
+
+    # Handle NaN VWAPs beforehand
+    vwap = _forward_fill(vwap)
+    with profile_stage('backtest.engine', rows=len(target)):
+        result = _backtest_arrays(target[None], vwap, capital, previous_held[None],
+                                  [cost_model or calculate_transaction_costs], stocks, volume)
+    rows = result['rows']
+
+    pnl_df = pd.DataFrame({
+        'Date': _interval_labels(labels[rows - 1]),
+        'Capital': result['capital'][0, 0],
+        'Return': result['ret'][0],
+        'Turnover': result['turnover'][0],
+        'Long': result['long'][0],
+        'Short': result['short'][0]
+    })
+
+    final_state = {
+        'capital': result['capital'][0, 0, -1] if len(rows) else capital,
+        'target': pd.Series(target[-1], index=stocks),
+        'held': pd.Series(result['held'][0], index=stocks),
+        'vwap': pd.Series(vwap[-1], index=stocks)
+    }
+    return pnl_df, final_state
+
+def backtest_vwap_strategy(mmep_data, position, initial_capital=1e7, output_file='pnl_file.csv', cost_model=None):
+    """
+    Backtest target positions at 5-minute VWAP prices, net of transaction costs.
+
+    :param mmep_data: A pandas DataFrame in MMEP format, containing 'vwap' and 'volume' columns.
+    :param position: A pandas DataFrame of target positions (time x stock), as returned by
+                     calculate_and_transform_position.
+    :param initial_capital: Starting capital.
+    :param output_file: CSV file the PnL data is written to. Pass None to only return it in memory.
+    :param cost_model: A cost_models.CostModel, or a function mapping turnover to transaction costs as a fraction of
+                       capital (default: calculate_transaction_costs).
+    :return: A pandas DataFrame with the Date, Capital, Return, Turnover, Long and Short of every interval.
+    """
+    # Calculate VWAP (and, for volume-aware costs, the volume) for every five minutes
+    vwap_5min = calculate_five_minute_vwap(mmep_data)
+    volume_5min = None
+    if cost_model is not None and as_cost_model(cost_model).needs_volume:
+        volume_5min = calculate_five_minute_volume(mmep_data)
+
+    pnl_df, _ = run_vwap_backtest(position, vwap_5min, initial_capital, cost_model=cost_model,
+                                  volume_5min=volume_5min)
 
     # Save to file
-    pnl_df.to_csv('pnl_file.csv', index=False)
+    if output_file is not None:
+        pnl_df.to_csv(output_file, index=False)
 
     return pnl_df
 
+def _run_sweep_chunk(target, vwap, initial_capital, cost_models, stocks, volume):
+    """
+    Run one chunk of sweep candidates (executed in a worker process when the sweep is parallel).
+    """
+    n_candidates = target.shape[0]
+    previous_held = np.full((n_candidates, target.shape[2]), np.nan)
+    return _backtest_arrays(target, vwap, initial_capital, previous_held, cost_models, stocks, volume)
+
+def backtest_vwap_sweep(mmep_data, positions, cost_scenarios=None, initial_capital=1e7, n_jobs=1):
+    """
+    Backtest many candidate position matrices under several cost scenarios in one batched pass.
+
+    The 5-minute VWAPs and their returns are computed once; the candidates are stacked along an extra axis and
+    evaluated together, optionally split across worker processes. Every cost scenario reuses the same returns and
+    trades, so a cost-sensitivity study only adds the cost evaluation per scenario.
+
+    :param mmep_data: A pandas DataFrame in MMEP format, containing 'vwap' and 'volume' columns.
+    :param positions: Dictionary of candidate name -> target position DataFrame (time x stock). All candidates are
+                      aligned to the index and columns of the first one.
+    :param cost_scenarios: Dictionary of scenario name -> cost_models.CostModel, or function mapping turnover to
+                           transaction costs as a fraction of capital (default: {'base': calculate_transaction_costs}).
+                           Models and functions must be picklable when n_jobs > 1.
+    :param initial_capital: Starting capital of every candidate.
+    :param n_jobs: Number of worker processes (1 runs in the current process, None uses os.cpu_count()).
+    :return: A tuple (pnl_paths, summary). pnl_paths is a long-format DataFrame with the columns candidate,
+             cost_scenario, Date, Capital, Return, Turnover, Long and Short; summary has one row per candidate and
+             cost scenario with total_return, gross_return, sharpe, max_drawdown and turnover.
+    """
+    if cost_scenarios is None:
+        cost_scenarios = {'base': calculate_transaction_costs}
+    names = list(positions)
+    scenario_names = list(cost_scenarios)
+    cost_models = list(cost_scenarios.values())
+
+    # Align every candidate to the first one and stack them along a leading candidate axis
+    reference = positions[names[0]]
+    index, stocks = reference.index, reference.columns
+    target = np.stack([positions[name].reindex(index=index, columns=stocks).to_numpy(dtype=np.float64, na_value=np.nan)
+                       for name in names])
+
+    # Calculate VWAP for every five minutes once for all candidates, handle NaN beforehand
+    vwap = _forward_fill(calculate_five_minute_vwap(mmep_data).reindex(index=index, columns=stocks)
+                         .to_numpy(dtype=np.float64))
+    volume = None
+    if any(as_cost_model(cost_model).needs_volume for cost_model in cost_models):
+        volume = calculate_five_minute_volume(mmep_data).reindex(index=index, columns=stocks).to_numpy(dtype=np.float64)
+
+    with profile_stage('backtest.sweep', rows=len(names) * len(index)):
+        n_jobs = n_jobs or os.cpu_count() or 1
+        if n_jobs == 1 or len(names) == 1:
+            results = [_run_sweep_chunk(target, vwap, initial_capital, cost_models, stocks, volume)]
+        else:
+            chunks = np.array_split(np.arange(len(names)), min(n_jobs, len(names)))
+            with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+                futures = [executor.submit(_run_sweep_chunk, target[chunk], vwap, initial_capital, cost_models,
+                                           stocks, volume) for chunk in chunks]
+                results = [future.result() for future in futures]
+
+    rows = results[0]['rows']
+    ret = np.concatenate([result['ret'] for result in results])
+    turnover = np.concatenate([result['turnover'] for result in results])
+    capital = np.concatenate([result['capital'] for result in results], axis=1)
+    long_position = np.concatenate([result['long'] for result in results])
+    short_position = np.concatenate([result['short'] for result in results])
+
+    # Tidy PnL paths: one block of rows per (cost scenario, candidate)
+    dates = _interval_labels(index[rows])
+    n_rows = len(rows)
+    n_scenarios, n_candidates = len(scenario_names), len(names)
+    pnl_paths = pd.DataFrame({
+        'candidate': np.tile(np.repeat(names, n_rows), n_scenarios),
+        'cost_scenario': np.repeat(scenario_names, n_candidates * n_rows),
+        'Date': np.tile(dates, n_scenarios * n_candidates),
+        'Capital': capital.reshape(-1),
+        'Return': np.tile(ret.reshape(-1), n_scenarios),
+        'Turnover': np.tile(turnover.reshape(-1), n_scenarios),
+        'Long': np.tile(long_position.reshape(-1), n_scenarios),
+        'Short': np.tile(short_position.reshape(-1), n_scenarios)
+    })
+
+    metrics = summarize_capital_paths(capital, ret[None], turnover[None], initial_capital)
+    summary = pd.DataFrame({
+        'candidate': np.tile(names, n_scenarios),
+        'cost_scenario': np.repeat(scenario_names, n_candidates),
+        **{name: np.broadcast_to(values, capital.shape[:2]).reshape(-1) for name, values in metrics.items()}
+    })
+
+    return pnl_paths, summary
+
+def save_backtest_checkpoint(checkpoint, checkpoint_file):
+    """
+    Atomically write a backtest checkpoint (see run_incremental_backtest) to a pickle file.
+
+    :param checkpoint: Dictionary with the 'version', 'last_date', backtest 'state' and running 'metrics'
+    :param checkpoint_file: Path of the checkpoint file
+    """
+    tmp_path = checkpoint_file + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, checkpoint_file)
+
+def load_backtest_checkpoint(checkpoint_file):
+    """
+    Load a backtest checkpoint written by save_backtest_checkpoint.
+
+    :param checkpoint_file: Path of the checkpoint file
+    :return: The checkpoint dictionary, or None if the file does not exist.
+    """
+    if not os.path.exists(checkpoint_file):
+        return None
+    with open(checkpoint_file, 'rb') as f:
+        checkpoint = pickle.load(f)
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version in {checkpoint_file}: {checkpoint.get('version')}")
+    return checkpoint
+
+def append_pnl_to_store(pnl_df, pnl_store):
+    """
+    Append PnL data to a columnar PnL store: one file per date (<pnl_store>/<mmdd>.npz) holding one array per column.
+
+    Only the dates in pnl_df are written; writing a date again replaces it, so re-running a day is idempotent.
+
+    :param pnl_df: A pandas DataFrame with the columns Date, Capital, Return, Turnover, Long and Short
+    :param pnl_store: Directory of the PnL store (created if missing)
+    """
+    os.makedirs(pnl_store, exist_ok=True)
+    for date, day_pnl in pnl_df.groupby(pnl_df['Date'].str[:4], sort=False):
+        file_path = os.path.join(pnl_store, f'{date}.npz')
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **{column: day_pnl[column].to_numpy(dtype=str if column == 'Date' else np.float64)
+                           for column in PNL_COLUMNS})
+        os.replace(tmp_path, file_path)
+
+def load_pnl_from_store(pnl_store, dates=None):
+    """
+    Load PnL data from a columnar PnL store.
+
+    :param pnl_store: Directory of the PnL store
+    :param dates: List of dates to load (default: all dates in the store)
+    :return: A pandas DataFrame with the columns Date, Capital, Return, Turnover, Long and Short, in date order.
+    """
+    available = sorted(file_name[:-4] for file_name in os.listdir(pnl_store) if file_name.endswith('.npz'))
+    dates = available if dates is None else [f'{date}' for date in dates if f'{date}' in available]
+    columns = {column: [] for column in PNL_COLUMNS}
+    for date in dates:
+        with np.load(os.path.join(pnl_store, f'{date}.npz')) as arrays:
+            for column in PNL_COLUMNS:
+                columns[column].append(arrays[column])
+    if not dates:
+        return pd.DataFrame(columns=PNL_COLUMNS)
+    return pd.DataFrame({column: np.concatenate(values) for column, values in columns.items()})
+
+def run_incremental_backtest(mmep_data, position, checkpoint_file, pnl_store=None, initial_capital=1e7,
+                             cost_model=None):
+    """
+    Resume a backtest from its checkpoint and run it on the new dates only.
+
+    The checkpoint holds the terminal backtest state (last target and held positions, last VWAP and capital), the
+    last date processed and running metrics, so each update costs time proportional to the new dates. Dates up to
+    the checkpoint's last date are skipped, which makes repeated updates idempotent. Without a checkpoint file the
+    backtest starts from initial_capital. The result equals a single backtest over all dates.
+
+    :param mmep_data: A pandas DataFrame in MMEP format with the 'vwap' and 'volume' of (at least) the new dates
+    :param position: A pandas DataFrame of target positions (time x stock) of (at least) the new dates
+    :param checkpoint_file: Path of the checkpoint file, updated after the run
+    :param pnl_store: Optional directory of a columnar PnL store the new PnL data is appended to
+    :param initial_capital: Starting capital when there is no checkpoint yet
+    :param cost_model: A cost_models.CostModel, or a function mapping turnover to transaction costs as a fraction of
+                       capital (default: calculate_transaction_costs).
+    :return: A tuple (pnl_df, checkpoint) with the PnL data of the new dates and the updated checkpoint. The
+             cumulative metrics are available through pnl_metrics.running_metrics_summary(checkpoint['metrics']).
+    """
+    checkpoint = load_backtest_checkpoint(checkpoint_file)
+    if checkpoint is not None:
+        position = position[position.index.get_level_values('didx') > checkpoint['last_date']]
+    if position.empty:
+        print(f"No new dates to backtest after {checkpoint['last_date'] if checkpoint else 'the start'}")
+        return pd.DataFrame(columns=PNL_COLUMNS), checkpoint
+
+    vwap_5min = calculate_five_minute_vwap(mmep_data)
+    volume_5min = None
+    if cost_model is not None and as_cost_model(cost_model).needs_volume:
+        volume_5min = calculate_five_minute_volume(mmep_data)
+
+    state = checkpoint['state'] if checkpoint is not None else None
+    metrics = checkpoint['metrics'] if checkpoint is not None else new_running_metrics(initial_capital)
+    pnl_df, state = run_vwap_backtest(position, vwap_5min, initial_capital, state, cost_model, volume_5min)
+    metrics = update_running_metrics(metrics, pnl_df['Capital'].to_numpy(), pnl_df['Return'].to_numpy(),
+                                     pnl_df['Turnover'].to_numpy())
 
+    if pnl_store is not None:
+        append_pnl_to_store(pnl_df, pnl_store)
+    checkpoint = {'version': CHECKPOINT_VERSION, 'last_date': position.index.get_level_values('didx')[-1],
+                  'state': state, 'metrics': metrics}
+    save_backtest_checkpoint(checkpoint, checkpoint_file)
+    print(f"Backtested up to {checkpoint['last_date']}: capital {state['capital']:.2f}")
+    return pnl_df, checkpoint
@@ -0,0 +1,255 @@
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+from data_processing import save_mmep_data_to_file, load_mmep_data_from_file
+from alpha_factors import calculate_five_minute_alpha_factors, calculate_and_transform_position
+from backtest import backtest_vwap_strategy
+from pnl_metrics import calculate_daily_pnl_metrics, calculate_monthly_pnl_metrics, calculate_pnl_metrics
+
+
+# All fields of the MMEP panel, as found in sample_data/
+MMEP_FIELDS = ['ask_twap', 'bid_twap', 'close', 'high', 'hit_volume', 'hit_vwap', 'last_ask', 'last_bid',
+               'lift_volume', 'lift_vwap', 'low', 'num_hit', 'num_lift', 'num_trade', 'open', 'volume', 'vwap']
+
+
+def synthetic_trading_dates(n_days, start_date='0401', year=2024):
+    """
+    Generate n_days consecutive weekdays in 'mmdd' format, starting from start_date.
+
+    :param n_days: Number of trading days
+    :param start_date: First calendar day to consider, in 'mmdd' format
+    :param year: Calendar year used to find the weekdays
+    :return: A list of dates formatted as ['0401', '0402', ...].
+    """
+    day = date(year, int(start_date[:2]), int(start_date[2:]))
+    dates = []
+    while len(dates) < n_days:
+        if day.weekday() < 5:
+            dates.append(day.strftime('%m%d'))
+        day += timedelta(days=1)
+    return dates
+
+
+def generate_synthetic_mmep(n_stocks=50, n_days=5, minutes_per_day=330, seed=0, start_date='0401'):
+    """
+    Generate a synthetic MMEP panel with all 17 fields.
+
+    Prices follow a per-stock random walk with intraday volatility; every minute has a consistent open/high/low/
+    close, a VWAP inside the high-low range, bid/ask quotes around it, and hit (sell) and lift (buy) trades whose
+    volumes and counts add up to the totals. Minutes without trades have NaN trade prices, like the real data.
+
+    :param n_stocks: Number of stocks
+    :param n_days: Number of trading days
+    :param minutes_per_day: Number of minute bars per day
+    :param seed: Random seed
+    :param start_date: First calendar day, in 'mmdd' format
+    :return: MMEP-format DataFrame with multi-index (didx, tidx) and (field, stock) columns.
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = n_days * minutes_per_day
+    shape = (n_rows, n_stocks)
+
+    # Price path: log random walk per stock, with a wider move at every open
+    base_price = np.exp(rng.uniform(np.log(2), np.log(400), n_stocks))
+    returns = rng.normal(0, 0.0008, shape)
+    returns[::minutes_per_day] += rng.normal(0, 0.01, (n_days, n_stocks))
+    close = base_price * np.exp(np.cumsum(returns, axis=0))
+    open_ = np.vstack([base_price, close[:-1]])
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.0004, shape)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.0004, shape)))
+    vwap = low + (high - low) * rng.uniform(0.2, 0.8, shape)
+
+    # Quotes: spread of a few basis points around the VWAP
+    half_spread = vwap * rng.uniform(0.0002, 0.002, shape)
+    bid_twap, ask_twap = vwap - half_spread, vwap + half_spread
+    last_bid = close - half_spread * rng.uniform(0.5, 1.5, shape)
+    last_ask = close + half_spread * rng.uniform(0.5, 1.5, shape)
+
+    # Trades: U-shaped intraday activity, split into hit (sell) and lift (buy) sides
+    minute = np.tile(np.arange(minutes_per_day), n_days)[:, None]
+    activity = 1 + 2 * ((minute / minutes_per_day - 0.5) * 2) ** 2
+    liquidity = rng.lognormal(0, 1, n_stocks)
+    num_hit = rng.poisson(3 * activity * liquidity)
+    num_lift = rng.poisson(3 * activity * liquidity)
+    lot = np.round(rng.lognormal(6, 0.5, n_stocks), -2) + 100
+    hit_volume = num_hit * lot * rng.uniform(0.5, 2, shape).round(1)
+    lift_volume = num_lift * lot * rng.uniform(0.5, 2, shape).round(1)
+    hit_vwap = np.where(num_hit > 0, np.clip(bid_twap + half_spread * rng.uniform(0, 0.5, shape), low, high), np.nan)
+    lift_vwap = np.where(num_lift > 0, np.clip(ask_twap - half_spread * rng.uniform(0, 0.5, shape), low, high), np.nan)
+
+    fields = {
+        'ask_twap': ask_twap, 'bid_twap': bid_twap, 'close': close, 'high': high,
+        'hit_volume': hit_volume, 'hit_vwap': hit_vwap, 'last_ask': last_ask, 'last_bid': last_bid,
+        'lift_volume': lift_volume, 'lift_vwap': lift_vwap, 'low': low,
+        'num_hit': num_hit, 'num_lift': num_lift, 'num_trade': num_hit + num_lift,
+        'open': open_, 'volume': hit_volume + lift_volume, 'vwap': vwap
+    }
+
+    stocks = [f'{i + 1:04d}.HK' for i in range(n_stocks)]
+    dates = synthetic_trading_dates(n_days, start_date)
+    index = pd.MultiIndex.from_product([dates, range(minutes_per_day)], names=['didx', 'tidx'])
+    columns = pd.MultiIndex.from_product([MMEP_FIELDS, stocks])
+    values = np.hstack([np.asarray(fields[field], dtype=np.float64) for field in MMEP_FIELDS])
+    return pd.DataFrame(values, index=index, columns=columns)
+
+
+def write_synthetic_csvs(mmep_data, data_dir):
+    """
+    Write an MMEP panel as {field}_{mmdd}.csv files laid out like sample_data/.
+
+    :param mmep_data: MMEP-format DataFrame
+    :param data_dir: Output directory (created if missing)
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    for date, day_data in mmep_data.groupby(level='didx'):
+        for field in mmep_data.columns.get_level_values(0).unique():
+            df = day_data[field].reset_index(drop=True)
+            df.insert(0, 'Minutes', range(len(df)))
+            df.to_csv(os.path.join(data_dir, f'{field}_{date}.csv'), index=False)
+
+
+def _measure(func, *args, measure_memory=True, **kwargs):
+    """
+    Time one call of func, then measure its peak traced memory in a second call.
+
+    :return: A tuple (result, seconds, peak_mb); peak_mb is NaN when measure_memory is False.
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    peak_mb = np.nan
+    if measure_memory:
+        tracemalloc.start()
+        func(*args, **kwargs)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result, seconds, peak_mb
+
+
+def benchmark_pipeline(n_stocks, n_days, minutes_per_day=330, seed=0, measure_memory=True, work_dir=None):
+    """
+    Time every stage of the pipeline on a synthetic panel and record its peak memory.
+
+    Stages: save_mmep_data_to_file (CSV ingestion), load_mmep_data_from_file, calculate_five_minute_alpha_factors,
+    calculate_and_transform_position, backtest_vwap_strategy, calculate_daily_pnl_metrics,
+    calculate_monthly_pnl_metrics and calculate_pnl_metrics (daily, weekly, monthly and 5-day rolling).
+
+    :param n_stocks: Number of stocks
+    :param n_days: Number of trading days
+    :param minutes_per_day: Number of minute bars per day
+    :param seed: Random seed of the synthetic panel
+    :param measure_memory: Also run every stage under tracemalloc to record its peak memory
+    :param work_dir: Directory for the synthetic CSV and pickle files (default: a temporary directory)
+    :return: A DataFrame with one row per stage: stage, n_stocks, n_days, minutes_per_day, seconds, peak_mb.
+    """
+    mmep_data = generate_synthetic_mmep(n_stocks, n_days, minutes_per_day, seed)
+    dates = list(mmep_data.index.get_level_values('didx').unique())
+    records = []
+
+    def record(stage, seconds, peak_mb):
+        records.append({'stage': stage, 'n_stocks': n_stocks, 'n_days': n_days, 'minutes_per_day': minutes_per_day,
+                        'seconds': seconds, 'peak_mb': peak_mb})
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        data_dir = os.path.join(tmp_dir, 'csv')
+        output_file = os.path.join(tmp_dir, 'mmep_data.pkl')
+        write_synthetic_csvs(mmep_data, data_dir)
+
+        # Parse in this process: tracemalloc does not see the memory of worker processes
+        _, seconds, peak_mb = _measure(save_mmep_data_to_file, data_dir, MMEP_FIELDS, dates, output_file, n_jobs=1,
+                                       measure_memory=measure_memory)
+        record('save_mmep_data_to_file', seconds, peak_mb)
+        _, seconds, peak_mb = _measure(load_mmep_data_from_file, output_file, measure_memory=measure_memory)
+        record('load_mmep_data_from_file', seconds, peak_mb)
+
+    _, seconds, peak_mb = _measure(calculate_five_minute_alpha_factors, mmep_data, measure_memory=measure_memory)
+    record('calculate_five_minute_alpha_factors', seconds, peak_mb)
+
+    position, seconds, peak_mb = _measure(calculate_and_transform_position, mmep_data, measure_memory=measure_memory)
+    record('calculate_and_transform_position', seconds, peak_mb)
+
+    pnl_df, seconds, peak_mb = _measure(backtest_vwap_strategy, mmep_data, position, output_file=None,
+                                        measure_memory=measure_memory)
+    record('backtest_vwap_strategy', seconds, peak_mb)
+
+    daily, seconds, peak_mb = _measure(lambda: calculate_daily_pnl_metrics(pnl_df.copy()),
+                                       measure_memory=measure_memory)
+    record('calculate_daily_pnl_metrics', seconds, peak_mb)
+
+    _, seconds, peak_mb = _measure(lambda: calculate_monthly_pnl_metrics(daily.copy()), measure_memory=measure_memory)
+    record('calculate_monthly_pnl_metrics', seconds, peak_mb)
+
+    _, seconds, peak_mb = _measure(calculate_pnl_metrics, pnl_df, rolling_days=[5], measure_memory=measure_memory)
+    record('calculate_pnl_metrics', seconds, peak_mb)
+
+    return pd.DataFrame(records)
+
+
+def run_benchmark_grid(stock_counts, day_counts, minutes_per_day=330, label='current', output_file=None,
+                       measure_memory=True):
+    """
+    Run benchmark_pipeline over a grid of universe sizes and history lengths.
+
+    :param stock_counts: List of stock counts
+    :param day_counts: List of day counts
+    :param minutes_per_day: Number of minute bars per day
+    :param label: Label of this run (e.g. a version or commit), stored with every result
+    :param output_file: Optional CSV file the results are appended to, so that runs can be compared later
+    :param measure_memory: Also record the peak memory of every stage
+    :return: A DataFrame with the results of every stage and grid point.
+    """
+    results = []
+    for n_stocks in stock_counts:
+        for n_days in day_counts:
+            result = benchmark_pipeline(n_stocks, n_days, minutes_per_day, measure_memory=measure_memory)
+            print(f"Benchmarked {n_stocks} stocks x {n_days} days")
+            results.append(result)
+
+    results = pd.concat(results, ignore_index=True)
+    results.insert(0, 'label', label)
+    results.insert(1, 'timestamp', pd.Timestamp.now().isoformat(timespec='seconds'))
+    if output_file is not None:
+        results.to_csv(output_file, mode='a', header=not os.path.exists(output_file), index=False)
+    return results
+
+
+def compare_benchmarks(results, baseline_label, candidate_label):
+    """
+    Compare two labelled benchmark runs stage by stage.
+
+    :param results: DataFrame of benchmark results (e.g. read back from run_benchmark_grid's output_file)
+    :param baseline_label: Label of the baseline run
+    :param candidate_label: Label of the run to compare against the baseline
+    :return: A DataFrame per stage and grid point with both timings and peak memories and their ratios
+             (candidate / baseline; below 1 is an improvement).
+    """
+    keys = ['stage', 'n_stocks', 'n_days', 'minutes_per_day']
+    metrics = ['seconds', 'peak_mb']
+    baseline = results[results['label'] == baseline_label].groupby(keys)[metrics].last()
+    candidate = results[results['label'] == candidate_label].groupby(keys)[metrics].last()
+    comparison = baseline.join(candidate, lsuffix='_baseline', rsuffix='_candidate', how='inner')
+    for metric in metrics:
+        comparison[f'{metric}_ratio'] = comparison[f'{metric}_candidate'] / comparison[f'{metric}_baseline']
+    return comparison.reset_index()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark every pipeline stage on synthetic MMEP data.')
+    parser.add_argument('--stocks', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--days', type=int, nargs='+', default=[5, 20])
+    parser.add_argument('--minutes', type=int, default=330)
+    parser.add_argument('--label', default='current')
+    parser.add_argument('--output', default='benchmark_results.csv')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc peak memory runs')
+    args = parser.parse_args()
+
+    results = run_benchmark_grid(args.stocks, args.days, args.minutes, args.label, args.output,
+                                 measure_memory=not args.no_memory)
+    print(results.to_string(index=False))
@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+
+
+class CostModel:
+    """
+    Transaction-cost model evaluated over whole (interval x stock) trade matrices.
+
+    Subclasses implement cost(trades, context) and return the costs of every interval as a fraction of the capital
+    before the trade:
+
+    - trades is an array (..., R, S) of signed position changes as fractions of capital (positive = buy, NaN = no
+      position on either side), with any number of leading batch axes (candidates).
+    - context is a dictionary with the 'stocks' Index of the S columns and the 'vwap' and 'volume' arrays (R, S)
+      of the traded intervals ('volume' is None unless the model sets needs_volume). Models that set
+      capital_dependent also get 'capital', an array (..., R) of the capital before each trade; the backtest then
+      evaluates them one interval at a time, as the capital depends on the costs charged before.
+
+    Models can be added together: model_a + model_b charges the sum of both costs.
+    """
+
+    capital_dependent = False
+    needs_volume = False
+
+    def cost(self, trades, context):
+        """
+        :param trades: Array (..., R, S) of signed position changes
+        :param context: Dictionary with 'stocks', 'vwap', 'volume' (and 'capital' for capital-dependent models)
+        :return: Array (..., R) of transaction costs as a fraction of capital.
+        """
+        raise NotImplementedError
+
+    def __add__(self, other):
+        return CombinedCostModel([self, as_cost_model(other)])
+
+
+class TurnoverCostModel(CostModel):
+    """
+    Wrap a function of turnover (the sum of absolute position changes of each interval), such as
+    backtest.calculate_transaction_costs, as a cost model.
+    """
+
+    def __init__(self, cost_function):
+        self.cost_function = cost_function
+
+    def cost(self, trades, context):
+        return self.cost_function(np.nansum(np.abs(trades), axis=-1))
+
+
+class LinearCostModel(CostModel):
+    """
+    Proportional costs with separate buy and sell rates, either one rate for all stocks or one rate per stock.
+    """
+
+    def __init__(self, buy_rate, sell_rate, default_rate=None):
+        """
+        :param buy_rate: Cost of buying as a fraction of the traded value: a number, or a pandas Series by stock
+        :param sell_rate: Cost of selling as a fraction of the traded value: a number, or a pandas Series by stock
+        :param default_rate: Rate of stocks missing from a per-stock Series (default: the Series' maximum)
+        """
+        self.buy_rate = buy_rate
+        self.sell_rate = sell_rate
+        self.default_rates = (default_rate, default_rate)
+
+    @staticmethod
+    def _stock_rates(rate, default_rate, stocks):
+        if not isinstance(rate, pd.Series):
+            return rate
+        default_rate = rate.max() if default_rate is None else default_rate
+        return rate.reindex(stocks).fillna(default_rate).to_numpy(dtype=np.float64)
+
+    def cost(self, trades, context):
+        buy_rate = self._stock_rates(self.buy_rate, self.default_rates[0], context['stocks'])
+        sell_rate = self._stock_rates(self.sell_rate, self.default_rates[1], context['stocks'])
+        bought = np.where(trades > 0, trades, 0)
+        sold = np.where(trades < 0, -trades, 0)
+        return np.sum(bought * buy_rate + sold * sell_rate, axis=-1)
+
+
+class HKTransactionCostModel(LinearCostModel):
+    """
+    Hong Kong market costs: stamp duty (separate buy and sell rates), HKEX trading fee, SFC and AFRC levies and a
+    fixed slippage, all proportional to the traded value. The defaults equal calculate_transaction_costs.
+    """
+
+    def __init__(self, stamp_duty_buy=0.001, stamp_duty_sell=0.001, trading_fee=0.00005, sfc_levy=0.00002,
+                 afrc_levy=0.000001, slippage=0.0002):
+        fees = trading_fee + sfc_levy + afrc_levy + slippage
+        super().__init__(stamp_duty_buy + fees, stamp_duty_sell + fees)
+
+
+class TieredCostModel(LinearCostModel):
+    """
+    Proportional costs by stock tier, e.g. a wider slippage for less liquid stocks.
+    """
+
+    def __init__(self, tiers, tier_rates, default_tier=None):
+        """
+        :param tiers: Mapping (dictionary or pandas Series) of stock -> tier name
+        :param tier_rates: Dictionary of tier name -> rate, or -> (buy_rate, sell_rate)
+        :param default_tier: Tier of stocks missing from tiers (default: the most expensive tier)
+        """
+        tiers = pd.Series(tiers, dtype=object)
+        rates = {tier: rate if isinstance(rate, tuple) else (rate, rate) for tier, rate in tier_rates.items()}
+        buy_rate = tiers.map({tier: rate[0] for tier, rate in rates.items()}).astype(np.float64)
+        sell_rate = tiers.map({tier: rate[1] for tier, rate in rates.items()}).astype(np.float64)
+        if default_tier is None:
+            default_tier = max(rates, key=lambda tier: sum(rates[tier]))
+        super().__init__(buy_rate, sell_rate)
+        self.default_rates = rates[default_tier]
+
+
+class SquareRootImpactModel(CostModel):
+    """
+    Volume-aware market impact: trading a value V in an interval where the market traded M costs
+    coefficient * sqrt(V / M) per unit traded, so the cost grows with the participation rate V / M.
+
+    The traded value V is the position change times the capital before the trade, and M the interval's volume times
+    its VWAP. The participation rate is capped at max_participation, which is also used when nothing traded.
+    """
+
+    capital_dependent = True
+    needs_volume = True
+
+    def __init__(self, coefficient=0.1, max_participation=1.0):
+        """
+        :param coefficient: Impact per unit traded at a participation rate of 1
+        :param max_participation: Cap of the participation rate
+        """
+        self.coefficient = coefficient
+        self.max_participation = max_participation
+
+    def cost(self, trades, context):
+        traded = np.abs(np.nan_to_num(trades))
+        market_value = np.nan_to_num(context['volume'] * context['vwap'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            participation = traded * context['capital'][..., None] / market_value
+        participation = np.where(market_value > 0, np.minimum(participation, self.max_participation),
+                                 self.max_participation)
+        return self.coefficient * np.sum(traded * np.sqrt(participation), axis=-1)
+
+
+class CombinedCostModel(CostModel):
+    """
+    Sum of several cost models.
+    """
+
+    def __init__(self, models):
+        self.models = [as_cost_model(model) for model in models]
+        self.capital_dependent = any(model.capital_dependent for model in self.models)
+        self.needs_volume = any(model.needs_volume for model in self.models)
+
+    def cost(self, trades, context):
+        return sum(model.cost(trades, context) for model in self.models)
+
+
+def as_cost_model(cost):
+    """
+    :param cost: A CostModel, or a function mapping turnover to costs as a fraction of capital
+    :return: A CostModel.
+    """
+    return cost if isinstance(cost, CostModel) else TurnoverCostModel(cost)
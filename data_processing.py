@@ -1,9 +1,113 @@
 import os
+import csv
+import json
 import pickle
+import hashlib
+import calendar
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
 import pandas as pd
 
+from profiling import profile_stage
 
-def save_mmep_data_to_file(data_dir, fields, dates, output_file):
+
+# Layout version of the columnar MMEP store written by save_mmep_data_to_store
+STORE_VERSION = 1
+STORE_META_FILE = 'meta.json'
+STORE_MANIFEST_FILE = 'manifest.json'
+
+# Opt-in compact dtype schema of the MMEP fields (see compact_mmep_data): float32 prices, and nullable 32-bit
+# integers for counts and volumes so that missing values stay missing (<NA>) instead of forcing float64
+COMPACT_MMEP_DTYPES = {
+    'ask_twap': 'float32', 'bid_twap': 'float32', 'close': 'float32', 'high': 'float32', 'hit_vwap': 'float32',
+    'last_ask': 'float32', 'last_bid': 'float32', 'lift_vwap': 'float32', 'low': 'float32', 'open': 'float32',
+    'vwap': 'float32',
+    'hit_volume': 'Int32', 'lift_volume': 'Int32', 'volume': 'Int32',
+    'num_hit': 'Int32', 'num_lift': 'Int32', 'num_trade': 'Int32'
+}
+
+
+def _parse_field_csv(file_path, columns=None):
+    """
+    Parse one {field}_{mmdd}.csv file into a float64 DataFrame (minutes x stocks), dropping the 'Minutes' column.
+
+    :param file_path: Path to the CSV file
+    :param columns: Optional list of stock columns to parse (all of them must be in the file); default: all stocks
+    :return: The parsed DataFrame.
+    """
+    usecols = (lambda col: 'Minutes' not in col) if columns is None else columns
+    try:
+        return pd.read_csv(file_path, usecols=usecols, dtype=np.float64)
+    except ValueError:
+        # Fall back to coercion if the file contains non-numeric tokens
+        df = pd.read_csv(file_path, usecols=usecols)
+        return df.apply(pd.to_numeric, errors='coerce').astype(np.float64)
+
+def _mmdd_date(date):
+    """
+    Normalize a date given as an integer or a string (e.g. 401 or '0401') to the 'mmdd' format, keeping None.
+    """
+    return None if date is None else f'{int(date):04d}'
+
+def _list_field_files(data_dir, fields, dates):
+    """
+    List the {field}_{mmdd}.csv files of the requested fields and dates with a single directory scan.
+
+    :param data_dir: Directory where the CSV files are stored
+    :param fields: List of field names
+    :param dates: List of dates
+    :return: A list of (date, field, file name, os.stat_result) tuples, ordered by date and then by field.
+    """
+    with os.scandir(data_dir) as entries:
+        available = {entry.name: entry for entry in entries if entry.is_file()}
+
+    files = []
+    for date in map(_mmdd_date, dates):
+        for field in fields:
+            file_name = f'{field}_{date}.csv'
+            if file_name in available:
+                files.append((date, field, file_name, available[file_name].stat()))
+    return files
+
+def _read_field_csvs(data_dir, files, n_jobs=None, columns=None):
+    """
+    Parse field CSV files in a process pool and yield them grouped by date.
+
+    :param data_dir: Directory where the CSV files are stored
+    :param files: List of (date, field, file name, stat) tuples as returned by _list_field_files
+    :param n_jobs: Number of worker processes (default: os.cpu_count()). Use 1 to parse in the current process.
+    :param columns: Optional list with the stock columns to parse of every file (default: all stocks)
+    :return: A generator of (date, {field: DataFrame}) pairs, in the order of files.
+    """
+    paths = [os.path.join(data_dir, file_name) for _, _, file_name, _ in files]
+    columns = [None] * len(paths) if columns is None else columns
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    if n_jobs == 1 or len(paths) <= 1:
+        parsed = map(_parse_field_csv, paths, columns)
+        yield from _group_by_date(files, parsed)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            chunksize = max(1, len(paths) // (n_jobs * 4))
+            parsed = executor.map(_parse_field_csv, paths, columns, chunksize=chunksize)
+            yield from _group_by_date(files, parsed)
+
+def _group_by_date(files, parsed):
+    """
+    Regroup an ordered stream of parsed field frames into per-date dictionaries.
+    """
+    current_date, date_data = None, {}
+    for (date, field, _, _), df in zip(files, parsed):
+        if date != current_date and date_data:
+            yield current_date, date_data
+            date_data = {}
+        current_date = date
+        date_data[field] = df
+    if date_data:
+        yield current_date, date_data
+
+def save_mmep_data_to_file(data_dir, fields, dates, output_file, n_jobs=None, dtypes=None):
     """
     Combine multiple CSV files into MMEP format and save the result as a pickle file.
 
@@ -11,39 +115,29 @@ def save_mmep_data_to_file(data_dir, fields, dates, output_file):
     :param fields: List of field names
     :param dates: List of dates
     :param output_file: Path to the output file where the combined data will be saved
+    :param n_jobs: Number of worker processes used to parse the CSV files (default: os.cpu_count())
+    :param dtypes: Optional dtype schema (e.g. COMPACT_MMEP_DTYPES) applied to the combined data before it is saved
+                   (see compact_mmep_data). By default every field is stored as float64.
     """
     all_data = []  # Store data for each day
 
-    for date in dates:
-        date_str = f'{date}'  # Format the date
-        date_data = {}
-
-        # Iterate over each field and load the data into the dictionary
-        for field in fields:
-            file_path = os.path.join(data_dir, f'{field}_{date_str}.csv')
-            if os.path.exists(file_path):
-                df = pd.read_csv(file_path)
-                df = df.apply(pd.to_numeric, errors='coerce')  # Ensure data is numeric
-                date_data[field] = df
-            else:
-                continue
-
-        if date_data:  # If data is successfully loaded
+    with profile_stage('data_processing.parse_csv') as stage:
+        files = _list_field_files(data_dir, fields, dates)
+        for date, date_data in _read_field_csvs(data_dir, files, n_jobs):
             combined_data = pd.concat(date_data.values(), axis=1, keys=date_data.keys())
-            combined_data['didx'] = date  # Set the date as an index
-            combined_data['tidx'] = combined_data.index  # Set minute index (row number)
+            # Set MultiIndex as (didx, tidx): the date and the minute index (row number)
+            combined_data.index = pd.MultiIndex.from_arrays(
+                [[date] * len(combined_data), range(len(combined_data))], names=['didx', 'tidx'])
             all_data.append(combined_data)
+        stage.rows = sum(len(combined_data) for combined_data in all_data)
 
     # Ensure there is data to concatenate
     if all_data:
         # Combine data from all dates
-        mmep_data = pd.concat(all_data, ignore_index=True)
-
-        # Set MultiIndex as (didx, tidx)
-        mmep_data.set_index(['didx', 'tidx'], inplace=True)
-
-        # Remove columns containing 'Minutes', which apply to all fields
-        mmep_data = mmep_data.drop(columns=[col for col in mmep_data.columns if 'Minutes' in col])
+        mmep_data = pd.concat(all_data)
+        del all_data
+        if dtypes is not None:
+            mmep_data = compact_mmep_data(mmep_data, dtypes)
 
         # Save the combined data to a pickle file
         with open(output_file, 'wb') as f:
@@ -53,6 +147,97 @@ def save_mmep_data_to_file(data_dir, fields, dates, output_file):
     else:
         print("No data to concatenate. Please check the file paths or field names.")
 
+def mmep_memory_report(mmep_data, compact_data):
+    """
+    Compare the memory footprint of the fields of two MMEP DataFrames, e.g. before and after compact_mmep_data.
+
+    :param mmep_data: The original MMEP-format DataFrame
+    :param compact_data: The compacted MMEP-format DataFrame
+    :return: A DataFrame with one row per field: dtype_before, dtype_after, mb_before, mb_after and saved_pct.
+    """
+    def field_usage(df):
+        usage = df.memory_usage(index=False)
+        return usage.groupby(level=0, sort=False).sum() / 2 ** 20
+
+    def field_dtype(df):
+        return pd.Series({field: str(df[field].dtypes.iloc[0]) if df[field].shape[1] else None
+                          for field in dict.fromkeys(df.columns.get_level_values(0))})
+
+    report = pd.DataFrame({'dtype_before': field_dtype(mmep_data), 'dtype_after': field_dtype(compact_data),
+                           'mb_before': field_usage(mmep_data), 'mb_after': field_usage(compact_data)})
+    report['saved_pct'] = (1 - report['mb_after'] / report['mb_before']) * 100
+    return report.rename_axis('field').reset_index()
+
+def _is_whole(values):
+    """
+    Whether float values are whole numbers, up to the rounding error of float arithmetic (e.g. 210.00000000000003).
+    """
+    return np.isclose(values, np.round(values), rtol=1e-9, atol=1e-9).all()
+
+def _compact_dtype(values, dtype):
+    """
+    Check that a field's values fit the requested compact dtype.
+
+    :param values: Field values as a float64 array (NaN for missing values)
+    :param dtype: Requested dtype, e.g. 'float32' or 'Int32'
+    :return: None if the values fit, otherwise the reason why they do not.
+    """
+    dtype = pd.api.types.pandas_dtype(dtype)
+    if dtype.kind not in 'iu':
+        return None
+    present = values[~np.isnan(values)]
+    if not _is_whole(present):
+        return 'values are not integers'
+    info = np.iinfo(getattr(dtype, 'numpy_dtype', dtype))
+    if present.size and (present.min() < info.min or present.max() > info.max):
+        return f'values are out of the {dtype} range'
+    if isinstance(dtype, np.dtype) and present.size < values.size:
+        return 'values are missing; use a nullable integer dtype (e.g. Int32)'
+    return None
+
+def compact_mmep_data(mmep_data, dtypes=None):
+    """
+    Cast the fields of an MMEP DataFrame to a compact dtype schema and report the memory saved.
+
+    Float fields are rounded to the requested precision. Integer fields must hold whole numbers (up to float
+    rounding error, which is rounded away) within the dtype's range. With a nullable integer dtype (e.g. 'Int32')
+    missing values become <NA>, which the factor and backtest code reads back as NaN; a field without missing values
+    gets the plain NumPy dtype (e.g. int32) instead, saving the mask. A field whose values do not fit its dtype is
+    kept as it is, with a message.
+
+    :param mmep_data: MMEP-format DataFrame with multi-index (didx, tidx) and (field, stock) columns
+    :param dtypes: Dictionary of field -> dtype (default: COMPACT_MMEP_DTYPES); fields not listed are unchanged
+    :return: The compacted MMEP-format DataFrame.
+    """
+    dtypes = COMPACT_MMEP_DTYPES if dtypes is None else dtypes
+    fields = list(dict.fromkeys(mmep_data.columns.get_level_values(0)))
+    field_frames = []
+    with profile_stage('data_processing.compact', rows=len(mmep_data)):
+        for field in fields:
+            field_data = mmep_data[field]
+            if field not in dtypes:
+                field_frames.append(field_data)
+                continue
+            values = field_data.to_numpy(dtype=np.float64, na_value=np.nan)
+            dtype = pd.api.types.pandas_dtype(dtypes[field])
+            reason = _compact_dtype(values, dtype)
+            if reason is not None:
+                print(f"Keeping {field} as {field_data.dtypes.iloc[0]}: {reason}")
+                field_frames.append(field_data)
+                continue
+            if dtype.kind in 'iu':
+                values = np.round(values)
+                if hasattr(dtype, 'numpy_dtype') and not np.isnan(values).any():
+                    dtype = dtype.numpy_dtype  # The mask of a nullable integer dtype is only needed for missing values
+            field_frames.append(pd.DataFrame(values, index=mmep_data.index, columns=field_data.columns).astype(dtype))
+        compact_data = pd.concat(field_frames, axis=1, keys=fields)
+
+    report = mmep_memory_report(mmep_data, compact_data)
+    mb_before, mb_after = report['mb_before'].sum(), report['mb_after'].sum()
+    print(f"Compacted MMEP data from {mb_before:.1f} MB to {mb_after:.1f} MB "
+          f"(saved {(1 - mb_after / mb_before) * 100 if mb_before else 0:.1f}%)")
+    return compact_data
+
 def generate_dates_range(start_date, end_date):
     """
     Generate a list of dates from start_date to end_date in the format 'mmdd'.
@@ -61,7 +246,9 @@ def generate_dates_range(start_date, end_date):
     :param end_date: End date, e.g., 1209 for December 9th.
     :return: A list of dates formatted as ['0401', '0402', ..., '1209'].
     """
-    return [f"{month:02d}{day:02d}" for month in range(4, 13) for day in range(1, 32)
+    # Only real calendar days are generated; April-December have the same length in every year
+    return [f"{month:02d}{day:02d}" for month in range(4, 13)
+            for day in range(1, calendar.monthrange(2024, month)[1] + 1)
             if f"{month:02d}{day:02d}" >= f"{start_date:04d}" and f"{month:02d}{day:02d}" <= f"{end_date:04d}"]
 
 def load_mmep_data_from_file(data_file):
@@ -71,25 +258,698 @@ def load_mmep_data_from_file(data_file):
     :param data_file: The MMEP data file (in pickle format).
     :return: The loaded MMEP data.
     """
-    with open(data_file, 'rb') as f:
-        mmep_data = pickle.load(f)
-    
+    with profile_stage('data_processing.load_pickle') as stage:
+        with open(data_file, 'rb') as f:
+            mmep_data = pickle.load(f)
+        stage.rows = len(mmep_data)
+
     return mmep_data
 
-def get_mmep_data(data_dir, fields, dates, output_file):
+def _scan_field_csv(file_path):
+    """
+    Read the header and count the data rows of one {field}_{mmdd}.csv file without parsing its values.
+
+    :param file_path: Path to the CSV file
+    :return: A tuple (stocks, n_rows) with the stock columns (without the 'Minutes' column) and the number of rows.
+    """
+    with open(file_path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode()]), [])
+        n_rows, last = 0, b'\n'
+        for block in iter(lambda: f.read(1 << 20), b''):
+            n_rows += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        n_rows += 1  # The last row has no trailing newline
+    return [column for column in header if 'Minutes' not in column], n_rows
+
+def build_mmep_catalog(data_dir, catalog_file=None, n_jobs=None):
+    """
+    Scan the CSV files of a data directory once and catalog the trading days, fields, row counts and stock columns.
+
+    Every {field}_{mmdd}.csv file is listed with one directory scan; only its header is parsed and its rows are
+    counted. When catalog_file exists, files whose size and mtime are unchanged are taken from it instead of being
+    scanned again, and the refreshed catalog is written back.
+
+    :param data_dir: Directory where the CSV files are stored
+    :param catalog_file: Optional JSON file the catalog is kept in
+    :param n_jobs: Number of worker processes used to scan the files (default: os.cpu_count())
+    :return: A dictionary {'data_dir', 'fields', 'dates', 'files'} where fields and dates (the trading days) are
+             sorted lists and files maps each file name to its 'field', 'date', 'n_rows', 'stocks', 'size' and
+             'mtime_ns'.
+    """
+    previous = {}
+    if catalog_file is not None and os.path.exists(catalog_file):
+        with open(catalog_file) as f:
+            previous = json.load(f)['files']
+
+    with profile_stage('data_processing.catalog') as stage:
+        with os.scandir(data_dir) as entries:
+            listed = [(entry.name, entry.stat()) for entry in entries
+                      if entry.is_file() and entry.name.endswith('.csv')]
+
+        files, pending = {}, []
+        for file_name, stat in listed:
+            field, _, date = file_name[:-4].rpartition('_')
+            if not field or len(date) != 4 or not date.isdigit():
+                continue
+            entry = {'field': field, 'date': date, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            cached = previous.get(file_name)
+            if cached is not None and all(cached[key] == entry[key] for key in ('size', 'mtime_ns')):
+                files[file_name] = cached
+            else:
+                files[file_name] = entry
+                pending.append(file_name)
+
+        paths = [os.path.join(data_dir, file_name) for file_name in pending]
+        n_jobs = n_jobs or os.cpu_count() or 1
+        if n_jobs == 1 or len(paths) <= 1:
+            scanned = list(map(_scan_field_csv, paths))
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                scanned = list(executor.map(_scan_field_csv, paths, chunksize=max(1, len(paths) // (n_jobs * 4))))
+        for file_name, (stocks, n_rows) in zip(pending, scanned):
+            files[file_name].update({'stocks': stocks, 'n_rows': n_rows})
+        stage.rows = len(pending)
+
+    catalog = {
+        'data_dir': data_dir,
+        'fields': sorted({entry['field'] for entry in files.values()}),
+        'dates': sorted({entry['date'] for entry in files.values()}),
+        'files': dict(sorted(files.items()))
+    }
+    if catalog_file is not None:
+        tmp_path = catalog_file + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(catalog, f)
+        os.replace(tmp_path, catalog_file)
+    print(f"Cataloged {len(files)} files ({len(pending)} scanned): {len(catalog['fields'])} fields, "
+          f"{len(catalog['dates'])} trading days")
+    return catalog
+
+def catalog_dates(catalog, start_date=None, end_date=None, fields=None):
+    """
+    List the trading days of a catalog within a date range.
+
+    :param catalog: Catalog returned by build_mmep_catalog
+    :param start_date: First date, e.g. 401 or '0401' (default: the first trading day)
+    :param end_date: Last date, e.g. 1209 or '1209' (default: the last trading day)
+    :param fields: Only keep the days that have a file for every one of these fields
+    :return: A sorted list of dates in 'mmdd' format.
+    """
+    start_date, end_date = _mmdd_date(start_date), _mmdd_date(end_date)
+    dates = [date for date in catalog['dates'] if (start_date is None or date >= start_date)
+             and (end_date is None or date <= end_date)]
+    if fields:
+        available = {(entry['field'], entry['date']) for entry in catalog['files'].values()}
+        dates = [date for date in dates if all((field, date) in available for field in fields)]
+    return dates
+
+def load_mmep_slice(data_dir, fields=None, stocks=None, start_date=None, end_date=None, catalog=None,
+                    catalog_file=None, n_jobs=1):
+    """
+    Load fields F, stocks S and dates D1-D2 of the raw CSV files into an MMEP-format DataFrame.
+
+    Only the files of the requested fields and dates are opened, and only the requested stock columns are parsed.
+    Files that hold none of the requested stocks are not opened at all; their rows come from the catalog.
+
+    :param data_dir: Directory where the CSV files are stored
+    :param fields: List of field names (default: every cataloged field)
+    :param stocks: List of stock columns (default: every stock of the selected files)
+    :param start_date: First date, e.g. 401 or '0401' (default: the first trading day)
+    :param end_date: Last date, e.g. 1209 or '1209' (default: the last trading day)
+    :param catalog: Catalog returned by build_mmep_catalog
+    :param catalog_file: JSON file of the catalog, used when no catalog is given (see build_mmep_catalog; only new or
+                         changed files are scanned)
+    :param n_jobs: Number of worker processes used to parse the CSV files (None uses os.cpu_count())
+    :return: MMEP-format DataFrame with multi-index (didx, tidx) and (field, stock) columns. Stocks missing from a
+             file are NaN.
+    """
+    if catalog is None:
+        if catalog_file is None:
+            raise ValueError("load_mmep_slice needs a catalog or a catalog_file (see build_mmep_catalog)")
+        catalog = build_mmep_catalog(data_dir, catalog_file, n_jobs)
+    fields = catalog['fields'] if fields is None else list(fields)
+    dates = set(catalog_dates(catalog, start_date, end_date))
+
+    files = [(entry['date'], entry['field'], file_name, entry) for file_name, entry in catalog['files'].items()
+             if entry['field'] in fields and entry['date'] in dates]
+    files.sort(key=lambda file: (file[0], fields.index(file[1])))
+    if stocks is None:
+        stocks = list(dict.fromkeys(stock for _, _, _, entry in files for stock in entry['stocks']))
+    else:
+        stocks = list(stocks)
+    wanted = set(stocks)
+    columns = {file_name: [stock for stock in entry['stocks'] if stock in wanted] for _, _, file_name, entry in files}
+
+    with profile_stage('data_processing.load_slice', rows=sum(entry['n_rows'] for *_, entry in files)):
+        # Parse the files holding some of the stocks; read_csv would return no rows at all for an empty usecols
+        parsed_files = [file for file in files if columns[file[2]]]
+        parsed = {}
+        for date, date_data in _read_field_csvs(data_dir, parsed_files, n_jobs,
+                                                [columns[file_name] for _, _, file_name, _ in parsed_files]):
+            parsed.update({(date, field): df for field, df in date_data.items()})
+
+        all_data = []
+        for date in sorted({date for date, _, _, _ in files}):
+            date_files = [(field, entry) for file_date, field, _, entry in files if file_date == date]
+            field_frames = [parsed[date, field].reindex(index=range(entry['n_rows']), columns=stocks)
+                            if (date, field) in parsed else
+                            pd.DataFrame(np.nan, index=range(entry['n_rows']), columns=stocks)
+                            for field, entry in date_files]
+            combined_data = pd.concat(field_frames, axis=1, keys=[field for field, _ in date_files])
+            combined_data.index = pd.MultiIndex.from_arrays(
+                [[date] * len(combined_data), range(len(combined_data))], names=['didx', 'tidx'])
+            all_data.append(combined_data)
+
+    if not all_data:
+        return pd.DataFrame(index=pd.MultiIndex.from_arrays([[], []], names=['didx', 'tidx']),
+                            columns=pd.MultiIndex.from_product([fields, stocks]), dtype=np.float64)
+    return pd.concat(all_data).reindex(columns=pd.MultiIndex.from_product([fields, stocks]))
+
+def _read_store_metadata(store_dir):
+    """
+    Read the metadata index of a columnar MMEP store, or return an empty index if the store does not exist yet.
+    """
+    meta_path = os.path.join(store_dir, STORE_META_FILE)
+    if not os.path.exists(meta_path):
+        return {'version': STORE_VERSION, 'fields': [], 'stocks': [], 'dates': {}}
+    with open(meta_path) as f:
+        return json.load(f)
+
+def _write_store_metadata(store_dir, meta):
+    """
+    Atomically replace the metadata index of a columnar MMEP store.
+    """
+    meta_path = os.path.join(store_dir, STORE_META_FILE)
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=1)
+    os.replace(tmp_path, meta_path)
+
+def _storage_dtype(dtypes):
+    """
+    NumPy dtype in which the columnar store and the shared panel keep a field, given the dtypes of its columns.
+
+    float32 and signed integer fields (including nullable ones such as Int32) keep their dtype, with missing integers
+    marked by the dtype's minimum (see _encode_missing); anything else is kept as float64.
+    """
+    dtypes = {np.dtype(getattr(dtype, 'numpy_dtype', dtype)) for dtype in dtypes}
+    if len(dtypes) == 1:
+        dtype = dtypes.pop()
+        if dtype == np.float32 or dtype.kind == 'i':
+            return dtype
+    return np.dtype(np.float64)
+
+def _encode_missing(values, dtype):
+    """
+    Cast float64 field values (NaN for missing values) to a storage dtype.
+
+    An integer dtype marks missing values with its minimum, so the values must be whole numbers above it; values that
+    do not fit are returned unchanged as float64.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return values.astype(dtype, copy=False)
+    info = np.iinfo(dtype)
+    missing = np.isnan(values)
+    present = np.round(values[~missing])
+    if not _is_whole(values[~missing]) or (present.size and (present.min() <= info.min or present.max() > info.max)):
+        return values
+    encoded = np.full(values.shape, info.min, dtype=dtype)
+    encoded[~missing] = present
+    return encoded
+
+def _decode_missing(array):
+    """
+    Values of a stored array as floats with NaN for missing values: float arrays are returned as they are, integer
+    arrays (see _encode_missing) as float64.
+    """
+    if array.dtype.kind == 'f':
+        return array
+    values = array.astype(np.float64)
+    values[array == np.iinfo(array.dtype).min] = np.nan
+    return values
+
+def _field_frame(values, index, columns):
+    """
+    Build the DataFrame of one field from a stored (rows x stocks) array, which it takes over without copying.
+    Integer arrays with missing values become nullable integer columns (e.g. Int32).
+    """
+    if values.dtype.kind == 'f':
+        return pd.DataFrame(values, index=index, columns=columns, copy=False)
+    missing = values == np.iinfo(values.dtype).min
+    if not missing.any():
+        return pd.DataFrame(values, index=index, columns=columns, copy=False)
+    return pd.DataFrame({column: pd.arrays.IntegerArray(values[:, j].copy(), missing[:, j].copy())
+                         for j, column in enumerate(columns)}, index=index)
+
+def _write_store_array(store_dir, field, date, values):
+    """
+    Write one (minute x stock) array of a field for a single date into the store.
+    """
+    field_dir = os.path.join(store_dir, field)
+    os.makedirs(field_dir, exist_ok=True)
+    file_path = os.path.join(field_dir, f'{date}.npy')
+    tmp_path = file_path + '.tmp.npy'
+    np.save(tmp_path, values)
+    os.replace(tmp_path, file_path)
+
+def _add_date_to_store(store_dir, meta, date, field_frames, dtypes=None):
+    """
+    Write the field frames of one date into the store and register the date in the metadata index.
+
+    New stock columns are appended to the end of the store's stock list, so every date only needs to cover a
+    prefix of that list; shorter dates are padded with NaN when they are loaded.
+
+    :param store_dir: Directory of the columnar store
+    :param meta: Metadata index (updated in place)
+    :param date: Date in 'mmdd' format
+    :param field_frames: Dictionary of field name -> DataFrame (minutes x stocks) without the 'Minutes' column
+    :param dtypes: Optional dictionary of field name -> storage dtype (see _storage_dtype); other fields are float64
+    """
+    stocks = meta['stocks']
+    known = set(stocks)
+    for df in field_frames.values():
+        for stock in df.columns:
+            if stock not in known:
+                stocks.append(stock)
+                known.add(stock)
+
+    entry = meta['dates'].get(date, {'fields': [], 'n_minutes': 0, 'n_stocks': 0})
+    date_stocks = [stock for stock in stocks if any(stock in df.columns for df in field_frames.values())]
+    n_stocks = stocks.index(date_stocks[-1]) + 1 if date_stocks else 0
+    n_minutes = max(len(df) for df in field_frames.values())
+
+    for field, df in field_frames.items():
+        values = df.reindex(index=range(n_minutes), columns=stocks[:n_stocks]).to_numpy(dtype=np.float64,
+                                                                                        na_value=np.nan)
+        if dtypes is not None and field in dtypes:
+            values = _encode_missing(values, dtypes[field])
+        _write_store_array(store_dir, field, date, values)
+        if field not in meta['fields']:
+            meta['fields'].append(field)
+
+    # A date may be updated one field at a time, so its shape only ever grows
+    entry['n_minutes'] = max(entry['n_minutes'], n_minutes)
+    entry['n_stocks'] = max(entry['n_stocks'], n_stocks)
+    entry['fields'] = [f for f in meta['fields'] if f in field_frames or f in entry['fields']]
+    meta['dates'][date] = entry
+    meta['dates'] = dict(sorted(meta['dates'].items()))
+
+def _file_signature(file_path, stat, use_hash=False):
+    """
+    Build the manifest signature of a source file from its size and mtime, plus its SHA-1 if use_hash is set.
+    """
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if use_hash:
+        sha1 = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(block)
+        signature['sha1'] = sha1.hexdigest()
+    return signature
+
+def _read_store_manifest(store_dir):
+    """
+    Read the manifest of source files already ingested into a columnar MMEP store.
+    """
+    manifest_path = os.path.join(store_dir, STORE_MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def _write_store_manifest(store_dir, manifest):
+    """
+    Atomically replace the manifest of a columnar MMEP store.
+    """
+    manifest_path = os.path.join(store_dir, STORE_MANIFEST_FILE)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def save_mmep_data_to_store(data_dir, fields, dates, store_dir, n_jobs=None, use_hash=False, dtypes=None):
+    """
+    Combine multiple CSV files into a columnar MMEP store, ingesting only new or changed files.
+
+    The store holds one .npy array (minutes x stocks) per field and date under store_dir/<field>/<mmdd>.npy, plus
+    a small metadata index (meta.json) with the field list, stock list and per-date shapes. Arrays can then be
+    memory-mapped individually, so a job only touches the fields and dates it asks for.
+
+    A manifest (manifest.json) records the size and mtime (and optionally the SHA-1) of every ingested source
+    file. Files whose signature is unchanged are skipped, so adding a trading day only parses that day's files.
+
+    With a dtype schema (e.g. COMPACT_MMEP_DTYPES) the arrays are written in compact dtypes: float32 fields as
+    float32 and integer fields as plain integers, with missing values marked by the dtype's minimum. The schema is
+    recorded in the metadata index and applies to later ingestions too; changing it re-ingests every file.
+
+    :param data_dir: Directory where the CSV files are stored
+    :param fields: List of field names
+    :param dates: List of dates
+    :param store_dir: Directory of the columnar store (created if missing)
+    :param n_jobs: Number of worker processes used to parse the CSV files (default: os.cpu_count())
+    :param use_hash: Also compare file contents by SHA-1, not only size and mtime
+    :param dtypes: Optional dictionary of field -> dtype (e.g. COMPACT_MMEP_DTYPES); default: the store's schema, or
+                   float64 for every field
+    :return: The number of files that were (re-)ingested.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    meta = _read_store_metadata(store_dir)
+    manifest = _read_store_manifest(store_dir)
+    if dtypes is not None:
+        dtypes = {field: str(pd.api.types.pandas_dtype(dtype)) for field, dtype in dtypes.items()}
+        if dtypes != meta.get('dtypes', {}):
+            manifest = {}  # Files ingested with another schema are written again
+            meta['dtypes'] = dtypes
+    storage_dtypes = {field: _storage_dtype([pd.api.types.pandas_dtype(dtype)])
+                      for field, dtype in meta.get('dtypes', {}).items()}
+
+    # Keep only the files that are new or whose signature has changed since the last ingestion
+    pending, signatures = [], {}
+    for date, field, file_name, stat in _list_field_files(data_dir, fields, dates):
+        signature = _file_signature(os.path.join(data_dir, file_name), stat, use_hash)
+        if manifest.get(file_name) != signature:
+            pending.append((date, field, file_name, stat))
+            signatures[file_name] = signature
+
+    if not pending:
+        if not meta['dates']:
+            print("No data to store. Please check the file paths or field names.")
+        return 0
+
+    with profile_stage('data_processing.ingest_store') as stage:
+        n_rows = 0
+        for date, date_data in _read_field_csvs(data_dir, pending, n_jobs):
+            _add_date_to_store(store_dir, meta, date, date_data, storage_dtypes)
+            n_rows += max(len(df) for df in date_data.values())
+        stage.rows = n_rows
+
+    _write_store_metadata(store_dir, meta)
+    manifest.update(signatures)
+    _write_store_manifest(store_dir, manifest)
+    print(f"Ingested {len(pending)} files into {store_dir}")
+    return len(pending)
+
+def write_mmep_data_to_store(mmep_data, store_dir):
+    """
+    Write an in-memory MMEP DataFrame (e.g. one loaded from a legacy pickle file) into a columnar store.
+
+    Fields keep compact dtypes (see compact_mmep_data): float32 and integer fields are stored as such.
+
+    :param mmep_data: MMEP-format DataFrame with multi-index (didx, tidx) and (field, stock) columns
+    :param store_dir: Directory of the columnar store (created if missing)
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    meta = _read_store_metadata(store_dir)
+    fields = list(dict.fromkeys(mmep_data.columns.get_level_values(0)))
+    dtypes = {field: _storage_dtype(mmep_data[field].dtypes) for field in fields}
+
+    for date, day_data in mmep_data.groupby(level='didx', sort=False):
+        day_data = day_data.droplevel('didx')
+        date_data = {field: day_data[field].reset_index(drop=True) for field in fields}
+        _add_date_to_store(store_dir, meta, _mmdd_date(date), date_data, dtypes)
+
+    _write_store_metadata(store_dir, meta)
+    print(f"Data saved to {store_dir}")
+
+def read_mmep_store_metadata(store_dir, dates=None):
+    """
+    Read the metadata index of a columnar MMEP store (fields, stocks and per-date shapes) without opening any array.
+
+    :param store_dir: Directory of the columnar store
+    :param dates: List of dates, e.g. 401 or '0401' (default: all dates in the store). Dates missing from the store
+                  are skipped.
+    :return: A tuple (meta, dates) with the metadata index and the selected dates in 'mmdd' format, in the order
+             they were requested (store order by default).
+    """
+    meta = _read_store_metadata(store_dir)
+    dates = list(meta['dates']) if dates is None else [date for date in map(_mmdd_date, dates) if date in meta['dates']]
+    return meta, dates
+
+def open_mmep_store(store_dir, fields=None, dates=None):
+    """
+    Memory-map the arrays of a columnar MMEP store without reading or copying them.
+
+    :param store_dir: Directory of the columnar store
+    :param fields: List of field names to open (default: all fields in the store)
+    :param dates: List of dates, e.g. 401 or '0401' (default: all dates in the store). Dates missing from the store
+                  are skipped.
+    :return: A tuple (meta, arrays) where arrays maps field -> {date -> read-only np.memmap (minutes x stocks)}.
+             Missing values are NaN in float arrays and the dtype's minimum in integer arrays.
+    """
+    meta, dates = read_mmep_store_metadata(store_dir, dates)
+    fields = meta['fields'] if fields is None else [field for field in fields if field in meta['fields']]
+
+    arrays = {}
+    for field in fields:
+        arrays[field] = {}
+        for date in dates:
+            if field in meta['dates'][date]['fields']:
+                file_path = os.path.join(store_dir, field, f'{date}.npy')
+                arrays[field][date] = np.load(file_path, mmap_mode='r')
+
+    return meta, arrays
+
+def mmep_store_signatures(store_dir, fields=None, dates=None):
+    """
+    Signatures (size and mtime) of the arrays of a columnar MMEP store, to tell whether a field of a date has been
+    rewritten without reading it.
+
+    :param store_dir: Directory of the columnar store
+    :param fields: List of field names (default: all fields in the store)
+    :param dates: List of dates, e.g. 401 or '0401' (default: all dates in the store). Dates missing from the store
+                  are skipped.
+    :return: A tuple (meta, signatures) where signatures maps field -> {date -> {'size', 'mtime_ns'}} for the
+             arrays present in the store.
+    """
+    meta, dates = read_mmep_store_metadata(store_dir, dates)
+    fields = meta['fields'] if fields is None else [field for field in fields if field in meta['fields']]
+
+    signatures = {}
+    for field in fields:
+        signatures[field] = {}
+        for date in dates:
+            if field in meta['dates'][date]['fields']:
+                file_path = os.path.join(store_dir, field, f'{date}.npy')
+                signatures[field][date] = _file_signature(file_path, os.stat(file_path))
+
+    return meta, signatures
+
+def load_mmep_data_from_store(store_dir, fields=None, dates=None):
+    """
+    Load the requested fields and dates of a columnar MMEP store into an MMEP-format DataFrame.
+
+    Only the selected arrays are read from disk; each is copied exactly once into the resulting frame. Fields keep
+    the dtypes they were stored in (see save_mmep_data_to_store); integer fields with missing values are loaded as
+    nullable integers (e.g. Int32).
+
+    :param store_dir: Directory of the columnar store
+    :param fields: List of field names to load (default: all fields in the store)
+    :param dates: List of dates to load, e.g. 401 or '0401' (default: all dates in the store)
+    :return: MMEP-format DataFrame with multi-index (didx, tidx) and (field, stock) columns.
+    """
+    meta, arrays = open_mmep_store(store_dir, fields, dates)
+    fields = list(arrays)
+    dates = list(dict.fromkeys(date for field_arrays in arrays.values() for date in field_arrays))
+    date_order = list(meta['dates'])
+    dates.sort(key=date_order.index)
+
+    # Only keep the stocks that appear in at least one of the selected dates
+    n_stocks = max((meta['dates'][date]['n_stocks'] for date in dates), default=0)
+    stocks = meta['stocks'][:n_stocks]
+
+    n_rows = sum(meta['dates'][date]['n_minutes'] for date in dates)
+    didx = np.repeat(dates, [meta['dates'][date]['n_minutes'] for date in dates]).tolist()
+    tidx = [minute for date in dates for minute in range(meta['dates'][date]['n_minutes'])]
+    index = pd.MultiIndex.from_arrays([didx, tidx], names=['didx', 'tidx'])
+    columns = pd.Index(stocks)
+
+    field_frames = []
+    with profile_stage('data_processing.load_store', rows=n_rows):
+        for field in fields:
+            # A field keeps its stored dtype unless its dates were stored with different dtypes
+            dtype = _storage_dtype([array.dtype for array in arrays[field].values()])
+            values = np.full((n_rows, n_stocks), np.iinfo(dtype).min if dtype.kind == 'i' else np.nan, dtype=dtype)
+            row = 0
+            for date in dates:
+                if date in arrays[field]:
+                    array = arrays[field][date]
+                    values[row:row + array.shape[0], :array.shape[1]] = (
+                        array if array.dtype == dtype else _decode_missing(array))
+                row += meta['dates'][date]['n_minutes']
+            field_frames.append(_field_frame(values, index, columns))
+
+    if not field_frames:
+        return pd.DataFrame(index=index, columns=pd.MultiIndex.from_product([fields, stocks]), dtype=np.float64)
+    return pd.concat(field_frames, axis=1, keys=fields)
+
+class SharedMMEPPanel:
+    """
+    Read-only MMEP panel in shared memory that worker processes can attach to without copying.
+
+    Every field is a dense (rows x stocks) array in the dtype the columnar store would keep it in (see
+    _storage_dtype): float32 and integer fields of a compact panel stay compact, with missing integers marked by the
+    dtype's minimum, and everything else is float64. All fields live one after another in one shared memory segment.
+    The row index (didx, tidx), field names, dtypes and stocks are kept in a small picklable spec, so only the spec
+    is sent to the workers. The process that created the panel owns the segment and must call unlink() (or use the
+    panel as a context manager) once the workers are done.
+    """
+
+    def __init__(self, spec, shm, owner=False):
+        self.spec = spec
+        self.shm = shm
+        self.owner = owner
+        self.fields = spec['fields']
+        self.stocks = pd.Index(spec['stocks'])
+        _, n_rows, n_stocks = spec['shape']
+        self.arrays = [np.ndarray((n_rows, n_stocks), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+                       for dtype, offset in zip(spec['dtypes'], spec['offsets'])]
+        for array in self.arrays:
+            array.flags.writeable = owner
+
+    @classmethod
+    def create(cls, mmep_data, fields=None):
+        """
+        Copy an MMEP DataFrame into a new shared memory segment.
+
+        :param mmep_data: MMEP-format DataFrame with multi-index (didx, tidx) and (field, stock) columns
+        :param fields: List of field names to share (default: every field of mmep_data)
+        :return: The owning SharedMMEPPanel.
+        """
+        if fields is None:
+            fields = list(dict.fromkeys(mmep_data.columns.get_level_values(0)))
+        stocks = mmep_data.columns.get_level_values(1).unique()
+        day_codes, days = pd.factorize(mmep_data.index.get_level_values('didx'))
+
+        with profile_stage('data_processing.share_panel', rows=len(mmep_data)):
+            arrays = []
+            for field in fields:
+                field_data = mmep_data.xs(field, level=0, axis=1)
+                # Stocks missing from the field are padded with NaN, which only float64 keeps as it is
+                dtype = _storage_dtype(list(field_data.dtypes) + [np.float64] * (len(stocks) - field_data.shape[1]))
+                values = field_data.reindex(columns=stocks).to_numpy(dtype=np.float64, na_value=np.nan)
+                arrays.append(_encode_missing(values, dtype))
+
+            # Field offsets in the segment, aligned to 8 bytes
+            sizes = [(array.nbytes + 7) // 8 * 8 for array in arrays]
+            offsets = [sum(sizes[:i]) for i in range(len(sizes))]
+            shm = shared_memory.SharedMemory(create=True, size=max(sum(sizes), 1))
+            spec = {'name': shm.name, 'shape': (len(fields), len(mmep_data), len(stocks)), 'fields': list(fields),
+                    'dtypes': [array.dtype.str for array in arrays], 'offsets': offsets, 'stocks': list(stocks),
+                    'days': list(days), 'day_codes': day_codes.astype(np.int32),
+                    'tidx': np.asarray(mmep_data.index.get_level_values('tidx'), dtype=np.int64)}
+            panel = cls(spec, shm, owner=True)
+            for shared, array in zip(panel.arrays, arrays):
+                shared[:] = array
+                shared.flags.writeable = False
+        return panel
+
+    @classmethod
+    def attach(cls, spec):
+        """
+        Attach to a panel created in another process (typically a worker of the owning process, which shares its
+        resource tracker, so the segment is not removed when the worker exits).
+
+        :param spec: The spec attribute of the owning panel
+        :return: A read-only SharedMMEPPanel viewing the same memory.
+        """
+        return cls(spec, shared_memory.SharedMemory(name=spec['name']))
+
+    @property
+    def index(self):
+        """
+        The (didx, tidx) row MultiIndex of the panel.
+        """
+        return pd.MultiIndex.from_arrays([np.asarray(self.spec['days'], dtype=object)[self.spec['day_codes']],
+                                          self.spec['tidx']], names=['didx', 'tidx'])
+
+    def field(self, field):
+        """
+        :param field: Field name
+        :return: A read-only (rows x stocks) view of the field in its shared dtype, without copying.
+        """
+        return self.arrays[self.fields.index(field)]
+
+    def field_values(self, field, stocks=slice(None)):
+        """
+        :param field: Field name
+        :param stocks: Slice of the stock columns to return
+        :return: The (rows x stocks) values of the field as floats with NaN for missing values: a view of float
+                 fields, a float64 copy of integer fields.
+        """
+        return _decode_missing(self.field(field)[:, stocks])
+
+    def to_frame(self, fields=None, rows=None):
+        """
+        Build an MMEP-format DataFrame (a copy) of the selected fields and rows.
+
+        :param fields: List of field names (default: every shared field)
+        :param rows: Positions (or a slice) of the rows to copy (default: every row)
+        :return: MMEP-format DataFrame with multi-index (didx, tidx) and (field, stock) columns.
+        """
+        fields = self.fields if fields is None else list(fields)
+        rows = slice(None) if rows is None else rows
+        index = self.index[rows]
+        if not fields:
+            return pd.DataFrame(index=index, columns=pd.MultiIndex.from_product([fields, self.stocks]))
+        return pd.concat([_field_frame(np.array(self.field(field)[rows]), index, self.stocks) for field in fields],
+                         axis=1, keys=fields)
+
+    def close(self):
+        """
+        Detach from the shared memory segment. Views obtained from field() must be released first.
+        """
+        self.arrays = None
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Detach from and remove the shared memory segment (owner only).
+        """
+        self.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.owner:
+            self.unlink()
+        else:
+            self.close()
+        return False
+
+def get_mmep_data(data_dir, fields, dates, output_file, dtypes=None, store_dir=None):
     """
     If the combined data file already exists locally, load it; otherwise, combine CSV files and save it.
-    
+
+    With store_dir, a columnar store is used instead of output_file: new or changed CSV files are ingested
+    incrementally, and only the requested fields and dates are loaded.
+
     :param data_dir: Directory where the CSV files are stored.
     :param fields: List of field names (columns).
     :param dates: List of dates for which data is needed.
-    :param output_file: Path to save the combined MMEP data file.
+    :param output_file: Path to save the combined MMEP data file (pickle); unused when store_dir is given.
+    :param dtypes: Optional dtype schema (e.g. COMPACT_MMEP_DTYPES) applied to the loaded data; a new pickle file is
+                   saved with it (see compact_mmep_data), and a store writes its arrays in it.
+    :param store_dir: Optional directory of a columnar MMEP store (see save_mmep_data_to_store) to use instead of
+                      the pickle file.
     :return: The loaded MMEP data.
     """
+    if store_dir is not None:
+        # The store is brought up to date on every call; unchanged source files are skipped via the manifest
+        print(f"Updating {store_dir} from CSV files")
+        save_mmep_data_to_store(data_dir, fields, dates, store_dir, dtypes=dtypes)
+        print(f"Loading data from {store_dir}")
+        return load_mmep_data_from_store(store_dir, fields, dates)
+
     if os.path.exists(output_file):
         print(f"Loading data from {output_file}")
-        return load_mmep_data_from_file(output_file)
+        mmep_data = load_mmep_data_from_file(output_file)
+        return mmep_data if dtypes is None else compact_mmep_data(mmep_data, dtypes)
     else:
         print(f"Combining data from CSV files and saving to {output_file}")
-        save_mmep_data_to_file(data_dir, fields, dates, output_file)
+        save_mmep_data_to_file(data_dir, fields, dates, output_file, dtypes=dtypes)
         return load_mmep_data_from_file(output_file)
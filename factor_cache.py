@@ -0,0 +1,172 @@
+import os
+import json
+import pickle
+import hashlib
+import numpy as np
+
+
+class FactorCache:
+    """
+    Disk-backed cache of per-date factor results with a size budget and LRU eviction.
+
+    Every date is one pickled file under cache_dir holding the results of all its cached factors, so a warm lookup
+    reads one file per date. Each result is stored with the key it was computed for (see
+    alpha_factors.calculate_five_minute_alpha_factors_cached, which builds it from a fingerprint of the factor's
+    input data and the factor version), and is reused only while the key matches. An index file (index.json)
+    records the size and access order of every date.
+    """
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, cache_dir, max_bytes=1 << 30):
+        """
+        :param cache_dir: Directory of the cache (created if missing)
+        :param max_bytes: Size budget of the cached entries; the least recently used dates are evicted beyond it
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+        index_path = os.path.join(cache_dir, self.INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {'clock': 0, 'entries': {}}
+
+    def _file_path(self, date):
+        return os.path.join(self.cache_dir, f'{date}.pkl')
+
+    def _touch(self, date):
+        self.index['clock'] += 1
+        self.index['entries'][date]['last_access'] = self.index['clock']
+
+    def _read(self, date):
+        """
+        Read the cached results of a date as a dictionary of factor -> (key, result).
+        """
+        file_path = self._file_path(date)
+        if date not in self.index['entries'] or not os.path.exists(file_path):
+            return {}
+        with open(file_path, 'rb') as f:
+            return pickle.load(f)
+
+    def get(self, date, keys):
+        """
+        Look up the cached factor results of a date.
+
+        :param date: Date in 'mmdd' format
+        :param keys: Dictionary of factor name -> key of the wanted result
+        :return: A dictionary of factor name -> result for the factors whose cached key matches.
+        """
+        entries = self._read(date)
+        results = {factor: entries[factor][1] for factor, key in keys.items()
+                   if factor in entries and entries[factor][0] == key}
+        if results:
+            self._touch(date)
+        self.hits += len(results)
+        self.misses += len(keys) - len(results)
+        return results
+
+    def put(self, date, keys, results):
+        """
+        Store factor results of a date, replacing older results of the same factors, and evict least recently used
+        dates if the size budget is exceeded.
+
+        :param date: Date in 'mmdd' format
+        :param keys: Dictionary of factor name -> key the result was computed for
+        :param results: Dictionary of factor name -> result
+        """
+        entries = self._read(date)
+        entries.update({factor: (keys[factor], result) for factor, result in results.items()})
+        data = pickle.dumps(entries, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(self._file_path(date), 'wb') as f:
+            f.write(data)
+
+        self.index['entries'][date] = {'size': len(data)}
+        self._touch(date)
+        self._evict()
+
+    def _evict(self):
+        entries = self.index['entries']
+        total = sum(entry['size'] for entry in entries.values())
+        for date in sorted(entries, key=lambda date: entries[date]['last_access']):
+            if total <= self.max_bytes:
+                break
+            total -= entries.pop(date)['size']
+            file_path = self._file_path(date)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            self.evictions += 1
+
+    def save(self):
+        """
+        Persist the index (sizes and access order) so that LRU order survives across sessions.
+        """
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, index_path)
+
+    def clear(self):
+        """
+        Remove every cached entry.
+        """
+        for date in list(self.index['entries']):
+            file_path = self._file_path(date)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        self.index['entries'] = {}
+        self.save()
+
+    def stats(self):
+        """
+        :return: A dictionary with the hit/miss/eviction counts, hit rate, number of cached dates and size in bytes.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self.index['entries']),
+            'size_bytes': sum(entry['size'] for entry in self.index['entries'].values()),
+            'max_bytes': self.max_bytes
+        }
+
+
+def row_checksums(values):
+    """
+    Cheap checksum of every row of a 2-D float array, for fingerprinting large inputs without hashing every byte.
+
+    Each value's bit pattern is multiplied by an odd per-column weight and the products are summed modulo 2**64,
+    so changing any single value (or moving it to another column) changes its row's checksum.
+
+    :param values: A 2-D float32 or float64 array (rows x columns)
+    :return: A uint64 array with one checksum per row.
+    """
+    values = np.asarray(values)
+    bits = values.view(np.uint32 if values.dtype.itemsize == 4 else np.uint64)
+    weights = np.arange(1, 2 * values.shape[1], 2, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return (bits * weights).sum(axis=1, dtype=np.uint64)
+
+
+def fingerprint_arrays(*arrays):
+    """
+    Fingerprint input data by hashing the bytes, shapes and dtypes of the given arrays.
+
+    :param arrays: NumPy arrays (or array-likes such as stock labels) making up the input
+    :return: A hex digest string.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        array = np.asarray(array)
+        if array.dtype == object:
+            array = array.astype(str)
+        digest.update(f'{array.dtype.str}{array.shape}'.encode())
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+
+
+def _to_panel(alpha):
+    """
+    Convert an alpha cross-section (Series) or panel (time x stock DataFrame) to a 2-D float array.
+
+    :param alpha: A pandas Series (one cross-section) or DataFrame (one cross-section per row)
+    :return: A tuple (values, wrap) where values is a 2-D float64 array and wrap converts a result array back
+             into the input's pandas type, index and columns.
+    """
+    if isinstance(alpha, pd.Series):
+        values = alpha.to_numpy(dtype=np.float64, na_value=np.nan)[None, :]
+        wrap = lambda result: pd.Series(result[0], index=alpha.index, name=alpha.name)
+    else:
+        values = np.ascontiguousarray(alpha.to_numpy(dtype=np.float64, na_value=np.nan))
+        wrap = lambda result: pd.DataFrame(result, index=alpha.index, columns=alpha.columns)
+    return values, wrap
+
+
+def _cross_sectional_rank(values):
+    """
+    Percentile rank (average method, NaN kept as NaN) of every row of a 2-D array.
+    """
+    # Keep rows contiguous so that row sums do not depend on how many rows are transformed together
+    return np.ascontiguousarray(pd.DataFrame(values).rank(axis=1, pct=True).to_numpy())
+
+
+def opRank(alpha):
+    """
+    Rank the alpha values of each cross-section and transform them into the range [-0.5, 0.5].
+
+    :param alpha: A pandas Series (one cross-section) or DataFrame (time x stock)
+    :return: The ranked alpha, with the same shape and labels as the input. NaN values stay NaN.
+    """
+    values, wrap = _to_panel(alpha)
+    return wrap(_cross_sectional_rank(values) - 0.5)
+
+
+def opSignedExp(alpha):
+    """
+    Apply an exponential transformation to the absolute alpha values while keeping their original signs.
+
+    :param alpha: A pandas Series (one cross-section) or DataFrame (time x stock)
+    :return: sign(alpha) * exp(|alpha|). Zeros stay zero and NaN values stay NaN.
+    """
+    values, wrap = _to_panel(alpha)
+    return wrap(np.sign(values) * np.exp(np.abs(values)))
+
+
+def _scale_long_short(values, long_sum=0.5, short_sum=-0.5):
+    """
+    Scale the positive and negative entries of every row of a 2-D array to the given sums, ignoring NaN.
+    """
+    positive = values > 0
+    negative = values < 0
+    positive_sum = np.where(positive, values, 0).sum(axis=1, keepdims=True)
+    negative_sum = np.where(negative, values, 0).sum(axis=1, keepdims=True)
+
+    # Rows without positive (or negative) entries are left unscaled on that side
+    with np.errstate(divide='ignore', invalid='ignore'):
+        positive_scale = np.where(positive_sum != 0, long_sum / positive_sum, 1.0)
+        negative_scale = np.where(negative_sum != 0, short_sum / negative_sum, 1.0)
+    return np.where(positive, values * positive_scale, np.where(negative, values * negative_scale, values))
+
+
+def opScaleLongShort(alpha, long_sum=0.5, short_sum=-0.5):
+    """
+    Scale the positive and negative portions of each cross-section separately such that:
+       - The positive part sums to long_sum (+0.5 by default).
+       - The negative part sums to short_sum (-0.5 by default).
+
+    :param alpha: A pandas Series (one cross-section) or DataFrame (time x stock)
+    :param long_sum: Target sum of the positive entries
+    :param short_sum: Target sum of the negative entries
+    :return: The scaled alpha. NaN values stay NaN and are ignored in the sums.
+    """
+    values, wrap = _to_panel(alpha)
+    return wrap(_scale_long_short(values, long_sum, short_sum))
+
+
+def opPower(alpha):
+    """
+    Apply the opPower transformation on the alpha factor:
+
+    1. Rank the alpha values, transforming them into a range of [-0.5, 0.5].
+    2. Apply an exponential transformation to the absolute values while keeping the original signs.
+    3. Scale the positive and negative portions separately such that:
+       - The positive part sums to +0.5.
+       - The negative part sums to -0.5.
+
+    Every row of a DataFrame is treated as one cross-section, so a whole (time x stock) panel is transformed at
+    once.
+
+    :param alpha: A pandas Series (one cross-section, e.g. across multiple stocks) or DataFrame (time x stock).
+    :return: The transformed alpha where the positive and negative parts of each cross-section sum to +0.5 and
+             -0.5, respectively.
+    """
+    values, wrap = _to_panel(alpha)
+    ranked = _cross_sectional_rank(values) - 0.5
+    transformed = np.sign(ranked) * np.exp(np.abs(ranked))
+    return wrap(_scale_long_short(transformed))
+
+
+def opDemean(alpha):
+    """
+    Subtract the cross-sectional mean from each cross-section.
+
+    :param alpha: A pandas Series (one cross-section) or DataFrame (time x stock)
+    :return: The demeaned alpha. NaN values stay NaN and are ignored in the mean.
+    """
+    values, wrap = _to_panel(alpha)
+    with np.errstate(invalid='ignore'):
+        count = np.sum(~np.isnan(values), axis=1, keepdims=True)
+        mean = np.nansum(values, axis=1, keepdims=True) / count
+    return wrap(values - mean)
+
+
+def opZscore(alpha):
+    """
+    Standardize each cross-section to zero mean and unit (sample) standard deviation.
+
+    :param alpha: A pandas Series (one cross-section) or DataFrame (time x stock)
+    :return: The z-scored alpha. Cross-sections with zero dispersion or fewer than two values become NaN.
+    """
+    values, wrap = _to_panel(alpha)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        count = np.sum(~np.isnan(values), axis=1, keepdims=True)
+        mean = np.nansum(values, axis=1, keepdims=True) / count
+        demeaned = values - mean
+        std = np.sqrt(np.nansum(demeaned ** 2, axis=1, keepdims=True) / (count - 1))
+        zscore = np.where(std > 0, demeaned / std, np.nan)
+    return wrap(zscore)
+
+
+def opDecay(alpha, window):
+    """
+    Linearly decayed moving average along the time axis: the current value has weight window, the previous one
+    window - 1, and so on down to 1.
+
+    NaN values are skipped and the weights of the remaining values renormalized; a stock with no valid value in
+    the window gets NaN.
+
+    :param alpha: A pandas DataFrame (time x stock)
+    :param window: Number of periods in the decay window
+    :return: The decayed alpha, with the same shape and labels as the input.
+    """
+    values, wrap = _to_panel(alpha)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+
+    weighted_sum = np.zeros_like(filled)
+    weight_sum = np.zeros_like(filled)
+    for lag in range(min(window, len(filled))):
+        weight = window - lag
+        weighted_sum[lag:] += weight * filled[:len(filled) - lag]
+        weight_sum[lag:] += weight * valid[:len(valid) - lag]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        decayed = np.where(weight_sum > 0, weighted_sum / weight_sum, np.nan)
+    return wrap(decayed)
+
+
+def opTruncate(alpha, max_weight):
+    """
+    Cap the absolute weight of every stock at max_weight times the gross exposure of its cross-section.
+
+    :param alpha: A pandas Series (one cross-section) or DataFrame (time x stock)
+    :param max_weight: Maximum weight of a single stock, as a fraction of the cross-section's sum of |alpha|
+    :return: The truncated alpha. NaN values stay NaN.
+    """
+    values, wrap = _to_panel(alpha)
+    limit = max_weight * np.nansum(np.abs(values), axis=1, keepdims=True)
+    return wrap(np.clip(values, -limit, limit))
@@ -0,0 +1,229 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from profiling import profile_stage
+from data_processing import read_mmep_store_metadata, load_mmep_data_from_store, SharedMMEPPanel
+from alpha_factors import calculate_and_transform_position, required_fields
+from backtest import (PNL_COLUMNS, calculate_five_minute_vwap, run_vwap_backtest, load_backtest_checkpoint,
+                      run_incremental_backtest)
+from pnl_metrics import summarize_capital_paths
+
+
+def _date_chunks(dates, chunk_days):
+    """
+    Split a list of dates into consecutive blocks of chunk_days dates.
+    """
+    return [dates[i:i + chunk_days] for i in range(0, len(dates), chunk_days)]
+
+
+def run_chunked_pipeline(store_dir, dates=None, chunk_days=1, initial_capital=1e7, factors=None,
+                         output_file=None):
+    """
+    Run data load, factor computation, position transform and backtest one block of days at a time.
+
+    Only one block of the MMEP panel (and its intermediates) is in memory at any time. The factors only depend on a
+    single day's bars, so the only state carried across blocks is the backtest's terminal state: the last target
+    and held positions, the last VWAP and the capital. The result equals a single run over all dates.
+
+    :param store_dir: Directory of a columnar MMEP store (see save_mmep_data_to_store)
+    :param dates: List of dates to run (default: all dates in the store)
+    :param chunk_days: Number of days loaded and processed per block
+    :param initial_capital: Starting capital
+    :param factors: List of factor names to combine (default: every registered factor)
+    :param output_file: Optional CSV file the PnL data is appended to block by block
+    :return: A tuple (pnl_df, state) with the PnL data of all blocks and the final backtest state.
+    """
+    meta, dates = read_mmep_store_metadata(store_dir, dates)
+    dates.sort(key=list(meta['dates']).index)
+
+    # Only the fields needed by the factors and the VWAP backtest are loaded
+    fields = list(dict.fromkeys(required_fields(factors) + ['vwap', 'volume']))
+
+    state = None
+    pnl_chunks = []
+    for chunk in _date_chunks(dates, chunk_days):
+        mmep_data = load_mmep_data_from_store(store_dir, fields, chunk)
+        position = calculate_and_transform_position(mmep_data, factors=factors)
+        vwap_5min = calculate_five_minute_vwap(mmep_data)
+        del mmep_data
+
+        pnl_df, state = run_vwap_backtest(position, vwap_5min, initial_capital, state)
+        if output_file is not None:
+            pnl_df.to_csv(output_file, mode='w' if not pnl_chunks else 'a', header=not pnl_chunks, index=False)
+        pnl_chunks.append(pnl_df)
+        print(f"Processed {chunk[0]}-{chunk[-1]}: capital {state['capital']:.2f}")
+
+    pnl_df = pd.concat(pnl_chunks, ignore_index=True) if pnl_chunks else pd.DataFrame(columns=PNL_COLUMNS)
+    return pnl_df, state
+
+
+def run_daily_update(store_dir, checkpoint_file, pnl_store=None, dates=None, initial_capital=1e7, factors=None,
+                     cost_model=None):
+    """
+    Bring a checkpointed backtest up to date with the dates added to a columnar MMEP store since its last run.
+
+    Only the new dates are loaded, one at a time, and pushed through the factors, the position transform and
+    run_incremental_backtest, so a daily update costs time proportional to one day rather than to the history.
+
+    :param store_dir: Directory of a columnar MMEP store (see save_mmep_data_to_store)
+    :param checkpoint_file: Path of the backtest checkpoint file (created on the first run)
+    :param pnl_store: Optional directory of a columnar PnL store the new PnL data is appended to
+    :param dates: List of dates to consider (default: all dates in the store)
+    :param initial_capital: Starting capital when there is no checkpoint yet
+    :param factors: List of factor names to combine (default: every registered factor)
+    :param cost_model: A cost_models.CostModel, or a function mapping turnover to transaction costs as a fraction of
+                       capital (default: calculate_transaction_costs)
+    :return: A tuple (pnl_df, checkpoint) with the PnL data of the new dates and the updated checkpoint.
+    """
+    _, dates = read_mmep_store_metadata(store_dir, dates)
+    checkpoint = load_backtest_checkpoint(checkpoint_file)
+    if checkpoint is not None:
+        dates = [date for date in dates if date > checkpoint['last_date']]
+
+    fields = list(dict.fromkeys(required_fields(factors) + ['vwap', 'volume']))
+    pnl_chunks = []
+    for date in sorted(dates):
+        mmep_data = load_mmep_data_from_store(store_dir, fields, [date])
+        position = calculate_and_transform_position(mmep_data, factors=factors)
+        pnl_df, checkpoint = run_incremental_backtest(mmep_data, position, checkpoint_file, pnl_store,
+                                                      initial_capital, cost_model)
+        pnl_chunks.append(pnl_df)
+
+    pnl_df = pd.concat(pnl_chunks, ignore_index=True) if pnl_chunks else pd.DataFrame(columns=PNL_COLUMNS)
+    return pnl_df, checkpoint
+
+
+def walk_forward_folds(dates, train_days, test_days, step_days=None, expanding=False):
+    """
+    Split a list of dates into consecutive walk-forward folds.
+
+    :param dates: Dates in 'mmdd' format, e.g. from generate_dates_range (dates missing from the panel are skipped
+                  when the folds are run)
+    :param train_days: Number of dates in every training window (the first one when expanding)
+    :param test_days: Number of dates in every test window, which directly follows its training window
+    :param step_days: Number of dates between the starts of consecutive folds (default: test_days)
+    :param expanding: Anchor every training window at the first date instead of rolling it forward
+    :return: A list of dictionaries {'train': [...], 'test': [...]}.
+    """
+    step_days = step_days or test_days
+    folds = []
+    for start in range(0, len(dates) - train_days - test_days + 1, step_days):
+        train_start = 0 if expanding else start
+        folds.append({'train': list(dates[train_start:start + train_days]),
+                      'test': list(dates[start + train_days:start + train_days + test_days])})
+    return folds
+
+
+# Panel used by _run_fold: the MMEP DataFrame when run in-process, or the SharedMMEPPanel each worker process
+# attaches to in _init_walk_forward_worker
+_walk_forward_panel = {}
+
+
+def _init_walk_forward_worker(spec):
+    _walk_forward_panel['panel'] = SharedMMEPPanel.attach(spec)
+
+
+def _run_fold(fold_id, fold, warmup_days, initial_capital, factors):
+    """
+    Compute the positions and PnL of the train and test windows of one fold on the shared panel.
+
+    Every window starts with initial_capital, but its backtest is warmed up on the warmup_days dates before it:
+    the positions and VWAPs of those dates are run through the backtest first, so the window's first interval
+    already trades from a held position and earns the return from the last warm-up VWAP.
+    """
+    panel = _walk_forward_panel['panel']
+    panel_didx = panel.index.get_level_values('didx')
+    panel_dates = list(panel_didx.unique())
+
+    windows = {}
+    for sample in ('train', 'test'):
+        sample_dates = set(f'{date}' for date in fold[sample])
+        dates = [date for date in panel_dates if date in sample_dates]
+        if dates:
+            start = panel_dates.index(dates[0])
+            windows[sample] = (panel_dates[max(start - warmup_days, 0):start], dates)
+
+    # Factors are day-local, so the positions of every date needed by the fold are computed in one pass
+    needed = set(date for warmup, dates in windows.values() for date in warmup + dates)
+    needed = [date for date in panel_dates if date in needed]
+    if isinstance(panel, SharedMMEPPanel):
+        # Only the fold's rows are copied out of shared memory
+        fold_data = panel.to_frame(rows=np.flatnonzero(panel_didx.isin(needed)))
+    else:
+        fold_data = panel.loc[needed]
+    position = calculate_and_transform_position(fold_data, factors=factors)
+    vwap_5min = calculate_five_minute_vwap(fold_data)
+    del fold_data
+
+    pnl_chunks = []
+    for sample, (warmup, dates) in windows.items():
+        state = None
+        if warmup:
+            _, state = run_vwap_backtest(position.loc[warmup], vwap_5min.loc[warmup], initial_capital)
+            state['capital'] = initial_capital
+        pnl_df, _ = run_vwap_backtest(position.loc[dates], vwap_5min.loc[dates], initial_capital, state)
+        pnl_chunks.append(pnl_df.assign(fold=fold_id, sample=sample))
+    return pd.concat(pnl_chunks, ignore_index=True)
+
+
+def run_walk_forward(mmep_data, folds, warmup_days=1, initial_capital=1e7, factors=None, n_jobs=None):
+    """
+    Evaluate a strategy on walk-forward folds in parallel, sharing one loaded panel across the worker processes.
+
+    The panel is loaded once (only the fields and dates used by the folds) and copied into shared memory (see
+    data_processing.SharedMMEPPanel); the workers attach to it and copy out only the rows of the fold they run, so
+    memory does not grow with the number of workers, whatever the process start method.
+
+    :param mmep_data: A pandas DataFrame in MMEP format, or the directory of a columnar MMEP store
+    :param folds: List of dictionaries {'train': [...], 'test': [...]} of 'mmdd' dates (see walk_forward_folds)
+    :param warmup_days: Number of dates before every window used to warm up the backtest (see _run_fold)
+    :param initial_capital: Starting capital of every window
+    :param factors: List of factor names to combine (default: every registered factor)
+    :param n_jobs: Number of worker processes (1 runs in the current process, None uses os.cpu_count())
+    :return: A tuple (pnl_df, summary). pnl_df holds the PnL data of every window with fold and sample
+             ('train' or 'test') columns; summary has one row per fold and sample with the from and to dates,
+             total_return, gross_return, sharpe, max_drawdown and turnover.
+    """
+    fields = list(dict.fromkeys(required_fields(factors) + ['vwap', 'volume']))
+    if isinstance(mmep_data, pd.DataFrame):
+        mmep_data = mmep_data.loc[:, mmep_data.columns.get_level_values(0).isin(fields)]
+    else:
+        _, store_dates = read_mmep_store_metadata(mmep_data)
+        fold_dates = set(f'{date}' for fold in folds for dates in fold.values() for date in dates)
+        positions = [i for i, date in enumerate(store_dates) if date in fold_dates]
+        dates = store_dates[max(positions[0] - warmup_days, 0):positions[-1] + 1]
+        mmep_data = load_mmep_data_from_store(mmep_data, fields, dates)
+
+    with profile_stage('pipeline.walk_forward', rows=len(folds)):
+        n_jobs = min(n_jobs or os.cpu_count() or 1, len(folds))
+        if n_jobs <= 1:
+            _walk_forward_panel['panel'] = mmep_data
+            results = [_run_fold(fold_id, fold, warmup_days, initial_capital, factors)
+                       for fold_id, fold in enumerate(folds)]
+            _walk_forward_panel.clear()
+        else:
+            panel = SharedMMEPPanel.create(mmep_data, fields)
+            del mmep_data
+            try:
+                with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_walk_forward_worker,
+                                         initargs=(panel.spec,)) as executor:
+                    futures = [executor.submit(_run_fold, fold_id, fold, warmup_days, initial_capital, factors)
+                               for fold_id, fold in enumerate(folds)]
+                    results = [future.result() for future in futures]
+            finally:
+                panel.unlink()
+
+    pnl_df = pd.concat(results, ignore_index=True)
+    pnl_df = pnl_df[['fold', 'sample'] + [column for column in pnl_df.columns if column not in ('fold', 'sample')]]
+
+    # Merge the per-fold metrics into one table
+    rows = []
+    for (fold_id, sample), window in pnl_df.groupby(['fold', 'sample'], sort=False):
+        metrics = summarize_capital_paths(window['Capital'].to_numpy(), window['Return'].to_numpy(),
+                                          window['Turnover'].to_numpy(), initial_capital)
+        rows.append({'fold': fold_id, 'sample': sample, 'from': window['Date'].iloc[0][:4],
+                     'to': window['Date'].iloc[-1][:4], **{name: float(value) for name, value in metrics.items()}})
+    summary = pd.DataFrame(rows)
+    return pnl_df, summary
@@ -1,100 +1,355 @@
 import numpy as np
 import pandas as pd
 
-def calculate_daily_pnl_metrics(pnl_file):
-    pnl_df = pnl_file
-
-    # Extract the 'MMDD' portion of the date for daily grouping
-    pnl_df['Day'] = pnl_df['Date'].str[:4]
-
-    # Initialize lists for results
-    results = []
-
-    # Group data by day (assuming MMDD format)
-    daily_groups = pnl_df.groupby('Day')
+from profiling import profile_stage
 
-    for day, group in daily_groups:
-        # Total PnL (sum of returns)
-        tpnl = np.sum(group['Return'])
 
-        # Long and short exposure as sums for the day
-        long = np.sum(group['Long'])
-        short = np.sum(group['Short'])
+TRADING_DAYS_PER_YEAR = 252
 
-        # Average return for the day (percentage)
-        ret = np.mean(group['Return']) * 100
 
-        # Total turnover for the day
-        turnover = np.sum(group['Turnover'])
+def calculate_daily_pnl_metrics(pnl_file):
+    with profile_stage('pnl_metrics.daily', rows=len(pnl_file)):
+        pnl_df = pnl_file
 
-        # Maximum Drawdown calculation
-        capital = group['Capital'].values
-        high_water_mark = capital[0]  # Start with the first capital as the peak
-        max_drawdown = 0  # Initialize max drawdown
+        # Extract the 'MMDD' portion of the date for daily grouping
+        pnl_df['Day'] = pnl_df['Date'].str[:4]
+        daily_groups = pnl_df.groupby('Day')
 
-        for current_cap in capital:
-            if current_cap > high_water_mark:
-                high_water_mark = current_cap  # Update peak capital
-            current_drawdown = (high_water_mark - current_cap) / high_water_mark * 100  # Peak-to-trough drop in percentage
-            max_drawdown = max(max_drawdown, current_drawdown)  # Maximum drawdown observed
+        # Maximum drawdown: running peak of the capital within each day, starting with the day's first capital
+        capital = pnl_df['Capital']
+        high_water_mark = capital.groupby(pnl_df['Day']).cummax()
+        drawdown = (high_water_mark - capital) / high_water_mark * 100  # Peak-to-trough drop in percentage
 
-        # Add result for this day
-        results.append({
-            'from': group['Date'].iloc[0][:4],
-            'to': group['Date'].iloc[-1][:4],
+        pnl_summary_df = pd.DataFrame({
+            'from': daily_groups['Date'].first().str[:4],
+            'to': daily_groups['Date'].last().str[:4],
             'long': 10,
             'short': -10,
-            'return': ret,
-            'turnover': turnover,
-            'max_drawdown': max_drawdown  # Maximum drawdown in percentage
-        })
-
-    # Convert results to DataFrame
-    pnl_summary_df = pd.DataFrame(results)
+            'return': daily_groups['Return'].mean() * 100,  # Average return for the day (percentage)
+            'turnover': daily_groups['Turnover'].sum(),  # Total turnover for the day
+            'max_drawdown': drawdown.groupby(pnl_df['Day']).max()
+        }).reset_index(drop=True)
 
     return pnl_summary_df
 
 
 def calculate_monthly_pnl_metrics(daily_pnl_summary):
-    # Extract the month part from the 'from' or 'to' column (assuming format MMDD)
-    daily_pnl_summary['Month'] = daily_pnl_summary['from'].str[:2]  # Take only the first two characters for month
-
-    # Group by Month and calculate the maximum drawdown per month
-    monthly_drawdown = daily_pnl_summary.groupby('Month')['max_drawdown'].max()
-
-    # Initialize the results list to store the summary for each month
-    results = []
-
-    # Loop over each month group
-    for month, group in daily_pnl_summary.groupby('Month'):
-        # Calculate other metrics (sum or average) for the month as needed
-        long = group['long'].sum()
-        short = group['short'].sum()
-        ret = group['return'].sum()
-        turnover = group['turnover'].mean()
-        
-        # Calculate the Sharpe ratio: (mean return) / (std return) * sqrt(20) assuming 20 days/month
-        sharpe_ratio = (group['return'].mean() / group['return'].std()) * np.sqrt(20) if group['return'].std() != 0 else 0
-        
-        # Get the maximum drawdown for the month (calculated earlier)
-        max_drawdown = monthly_drawdown[month]
-        
-        # Append the monthly result to the list
-        results.append({
-            'from': group['from'].iloc[0][:4],
-            'to': group['to'].iloc[-1][:4],
+    with profile_stage('pnl_metrics.monthly', rows=len(daily_pnl_summary)):
+        # Extract the month part from the 'from' column (assuming format MMDD)
+        daily_pnl_summary['Month'] = daily_pnl_summary['from'].str[:2]
+        monthly_groups = daily_pnl_summary.groupby('Month')
+
+        # Sharpe ratio: (mean return) / (std return) * sqrt(20) assuming 20 days/month
+        mean = monthly_groups['return'].mean()
+        std = monthly_groups['return'].std()
+        sharpe_ratio = (mean / std * np.sqrt(20)).where(std != 0, 0)
+
+        monthly_summary_df = pd.DataFrame({
+            'from': monthly_groups['from'].first().str[:4],
+            'to': monthly_groups['to'].last().str[:4],
             'long': 10,
             'short': -10,
-            'return': ret,
+            'return': monthly_groups['return'].sum(),
             'sharpe': sharpe_ratio,
-            'turnover': turnover,
-            'max_drawdown': max_drawdown
+            'turnover': monthly_groups['turnover'].mean(),
+            'max_drawdown': monthly_groups['max_drawdown'].max()
+        }).reset_index(drop=True)
+
+    return monthly_summary_df
+
+
+def summarize_capital_paths(capital_path, ret, turnover, initial_capital):
+    """
+    Summary metrics of batched capital paths.
+
+    :param capital_path: Array (..., R) of capital after each interval
+    :param ret: Array (..., R) of gross interval returns
+    :param turnover: Array (..., R) of interval turnover
+    :param initial_capital: Capital before the first interval
+    :return: A dictionary of arrays (...) with the total return, Sharpe ratio of the net interval returns, maximum
+             drawdown (in percentage) and average turnover.
+    """
+    previous = np.concatenate([np.broadcast_to(initial_capital, capital_path.shape[:-1] + (1,)),
+                               capital_path[..., :-1]], axis=-1)
+    net_return = capital_path / previous - 1
+    high_water_mark = np.maximum.accumulate(np.maximum(capital_path, previous[..., :1]), axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = net_return.std(axis=-1, ddof=1)
+        sharpe = np.where(std > 0, net_return.mean(axis=-1) / std, 0)
+    return {
+        'total_return': capital_path[..., -1] / initial_capital - 1,
+        'gross_return': ret.sum(axis=-1),
+        'sharpe': sharpe,
+        'max_drawdown': ((high_water_mark - capital_path) / high_water_mark * 100).max(axis=-1),
+        'turnover': turnover.mean(axis=-1)
+    }
+
+
+def new_running_metrics(initial_capital):
+    """
+    Start cumulative metrics of a backtest that is extended interval block by interval block
+    (see update_running_metrics).
+
+    :param initial_capital: Capital before the first interval
+    :return: A dictionary of running sums, small enough to be kept in a backtest checkpoint.
+    """
+    return {'initial_capital': initial_capital, 'capital': initial_capital, 'peak_capital': initial_capital,
+            'intervals': 0, 'sum_return': 0.0, 'sum_squared_return': 0.0, 'gross_return': 0.0, 'turnover': 0.0,
+            'max_drawdown': 0.0}
+
+
+def update_running_metrics(metrics, capital_path, ret, turnover):
+    """
+    Extend cumulative metrics with the next block of intervals, without revisiting earlier intervals.
+
+    :param metrics: Dictionary returned by new_running_metrics or a previous update
+    :param capital_path: Array (R,) of capital after each new interval
+    :param ret: Array (R,) of gross returns of the new intervals
+    :param turnover: Array (R,) of turnover of the new intervals
+    :return: The updated dictionary (a new one; the input is left unchanged).
+    """
+    capital_path = np.asarray(capital_path, dtype=np.float64)
+    if len(capital_path) == 0:
+        return dict(metrics)
+    previous = np.concatenate([[metrics['capital']], capital_path[:-1]])
+    net_return = capital_path / previous - 1
+    high_water_mark = np.maximum.accumulate(np.concatenate([[metrics['peak_capital']], capital_path]))[1:]
+    drawdown = (high_water_mark - capital_path) / high_water_mark * 100
+    return {
+        'initial_capital': metrics['initial_capital'],
+        'capital': capital_path[-1],
+        'peak_capital': high_water_mark[-1],
+        'intervals': metrics['intervals'] + len(capital_path),
+        'sum_return': metrics['sum_return'] + net_return.sum(),
+        'sum_squared_return': metrics['sum_squared_return'] + (net_return ** 2).sum(),
+        'gross_return': metrics['gross_return'] + np.sum(ret),
+        'turnover': metrics['turnover'] + np.sum(turnover),
+        'max_drawdown': max(metrics['max_drawdown'], drawdown.max())
+    }
+
+
+def running_metrics_summary(metrics):
+    """
+    Summary of cumulative metrics, with the same definitions as summarize_capital_paths over all intervals so far.
+
+    :param metrics: Dictionary returned by update_running_metrics
+    :return: A dictionary with total_return, gross_return, sharpe, max_drawdown and turnover.
+    """
+    n = metrics['intervals']
+    mean = metrics['sum_return'] / n if n else 0.0
+    variance = (metrics['sum_squared_return'] - n * mean ** 2) / (n - 1) if n > 1 else 0.0
+    std = np.sqrt(max(variance, 0.0))
+    return {
+        'total_return': metrics['capital'] / metrics['initial_capital'] - 1,
+        'gross_return': metrics['gross_return'],
+        'sharpe': mean / std if std > 0 else 0,
+        'max_drawdown': metrics['max_drawdown'],
+        'turnover': metrics['turnover'] / n if n else 0.0
+    }
+
+
+def _period_keys(days, frequency, year):
+    """
+    Period label of every 'mmdd' day: the day itself ('D'), its ISO week ('W') or its month ('M').
+    """
+    days = pd.Index(days)
+    if frequency == 'D':
+        return days.to_numpy()
+    if frequency == 'M':
+        return days.str[:2].to_numpy()
+    if frequency == 'W':
+        week = pd.to_datetime(f'{year}' + days, format='%Y%m%d').isocalendar()
+        return (week['year'] * 100 + week['week']).to_numpy()
+    raise ValueError(f"Unknown frequency: {frequency}")
+
+
+def _segment_starts(keys):
+    """
+    Start positions of the runs of equal consecutive keys.
+    """
+    keys = np.asarray(keys)
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+
+def _segment_mean_std(values, starts, counts):
+    """
+    Mean and sample standard deviation of every segment along the last axis of a 2-D array.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.add.reduceat(values, starts, axis=-1) / counts
+        deviation = values - np.repeat(mean, counts, axis=-1)
+        std = np.sqrt(np.add.reduceat(deviation ** 2, starts, axis=-1) / (counts - 1))
+    return mean, std
+
+
+def _segment_max_drawdown(capital, starts):
+    """
+    Maximum drawdown (in percentage) of every segment along the last axis of a 2-D capital array, with the running
+    peak starting at the segment's first capital.
+    """
+    codes = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, capital.shape[-1]]))
+    high_water_mark = pd.DataFrame(capital.T).groupby(codes).cummax().to_numpy().T
+    drawdown = (high_water_mark - capital) / high_water_mark * 100
+    return np.maximum.reduceat(drawdown, starts, axis=-1)
+
+
+def _sharpe(mean, std, periods_per_year):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(std > 0, mean / std * np.sqrt(periods_per_year), 0)
+
+
+def _rolling_sum(values, window):
+    """
+    Sums over a trailing window of every full window along the last axis.
+    """
+    cumulative = np.cumsum(np.concatenate([np.zeros(values.shape[:-1] + (1,)), values], axis=-1), axis=-1)
+    return cumulative[..., window:] - cumulative[..., :-window]
+
+
+def calculate_pnl_metrics_arrays(dates, capital, ret, turnover, long, short, initial_capital=1e7,
+                                 frequencies=('D', 'W', 'M'), rolling_days=None, year=2024):
+    """
+    Period metrics of batched PnL paths, computed with array operations only.
+
+    Every frequency is a set of contiguous segments of the (time-ordered) intervals, so sums use np.add.reduceat
+    and the drawdown peaks a grouped running maximum; no Python loop runs over intervals or periods. Rolling
+    windows are evaluated on the daily series of every path.
+
+    :param dates: Interval labels in the 'mmdd-bb' format of the PnL data's Date column, in time order
+    :param capital: Array (B, R) of capital after each interval, one row per path
+    :param ret: Array (B, R) or (R,) of gross interval returns
+    :param turnover: Array (B, R) or (R,) of interval turnover
+    :param long: Array (B, R) or (R,) of long exposure
+    :param short: Array (B, R) or (R,) of short exposure
+    :param initial_capital: Capital before the first interval (scalar or one value per path)
+    :param frequencies: Period frequencies: 'D' (day), 'W' (ISO week) and/or 'M' (month)
+    :param rolling_days: Optional list of rolling window lengths, in days
+    :param year: Calendar year of the 'mmdd' dates (used for the ISO weeks)
+    :return: A dictionary of frequency ('D', 'W', 'M' or 'rolling_<n>d') -> (periods, metrics), where periods is a
+             DataFrame with the from and to day of every period and metrics a dictionary of (B, P) arrays:
+             intervals, return (net compounded, in percentage), gross_return (in percentage), sharpe (annualized,
+             of the net interval returns, or of the daily net returns for rolling windows), turnover (sum), long
+             and short (mean exposure) and max_drawdown (in percentage).
+    """
+    capital = np.atleast_2d(np.asarray(capital, dtype=np.float64))
+    n_paths, n_rows = capital.shape
+    ret, turnover, long, short = [np.broadcast_to(np.asarray(values, dtype=np.float64), capital.shape)
+                                  for values in (ret, turnover, long, short)]
+    initial_capital = np.broadcast_to(np.asarray(initial_capital, dtype=np.float64).reshape(-1, 1), (n_paths, 1))
+
+    previous = np.concatenate([initial_capital, capital[:, :-1]], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        net_return = capital / previous - 1
+
+    # Days in order of appearance; intervals per day set the annualization of the interval Sharpe ratio
+    row_days = np.array([f'{date}'[:4] for date in dates])
+    day_starts = _segment_starts(row_days)
+    days = row_days[day_starts]
+    day_counts = np.diff(np.r_[day_starts, n_rows])
+    intervals_per_year = np.median(day_counts) * TRADING_DAYS_PER_YEAR
+
+    results = {}
+    for frequency in frequencies:
+        period_keys = _period_keys(days, frequency, year)
+        period_starts = _segment_starts(period_keys)
+        starts = day_starts[period_starts]
+        ends = np.r_[starts[1:], n_rows] - 1
+        counts = ends - starts + 1
+
+        mean, std = _segment_mean_std(net_return, starts, counts)
+        periods = pd.DataFrame({'from': days[period_starts], 'to': row_days[ends]})
+        results[frequency] = (periods, {
+            'intervals': np.broadcast_to(counts, (n_paths, len(starts))),
+            'return': (capital[:, ends] / previous[:, starts] - 1) * 100,
+            'gross_return': np.add.reduceat(ret, starts, axis=1) * 100,
+            'sharpe': _sharpe(mean, std, intervals_per_year),
+            'turnover': np.add.reduceat(turnover, starts, axis=1),
+            'long': np.add.reduceat(long, starts, axis=1) / counts,
+            'short': np.add.reduceat(short, starts, axis=1) / counts,
+            'max_drawdown': _segment_max_drawdown(capital, starts)
         })
 
-    # Convert the results list into a DataFrame
-    monthly_summary_df = pd.DataFrame(results)
+    # Rolling windows over the daily series: end-of-day capital, daily net returns and daily sums
+    day_ends = np.r_[day_starts[1:], n_rows] - 1
+    day_close = capital[:, day_ends]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily_return = day_close / previous[:, day_starts] - 1
+    daily_sums = {name: np.add.reduceat(values, day_starts, axis=1)
+                  for name, values in (('ret', ret), ('turnover', turnover), ('long', long), ('short', short))}
 
-    return monthly_summary_df
+    for window in rolling_days or []:
+        if window > len(days):
+            continue
+        counts = _rolling_sum(day_counts[None].astype(np.float64), window)
+        windows = np.lib.stride_tricks.sliding_window_view(daily_return, window, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            std = windows.std(axis=-1, ddof=1)
+        close_windows = np.lib.stride_tricks.sliding_window_view(day_close, window, axis=1)
+        high_water_mark = np.maximum.accumulate(close_windows, axis=-1)
+        periods = pd.DataFrame({'from': days[:len(days) - window + 1], 'to': days[window - 1:]})
+        results[f'rolling_{window}d'] = (periods, {
+            'intervals': np.broadcast_to(counts.astype(np.int64), (n_paths, counts.shape[1])),
+            'return': (day_close[:, window - 1:] / previous[:, day_starts[:len(days) - window + 1]] - 1) * 100,
+            'gross_return': _rolling_sum(daily_sums['ret'], window) * 100,
+            'sharpe': _sharpe(windows.mean(axis=-1), std, TRADING_DAYS_PER_YEAR),
+            'turnover': _rolling_sum(daily_sums['turnover'], window),
+            'long': _rolling_sum(daily_sums['long'], window) / counts,
+            'short': _rolling_sum(daily_sums['short'], window) / counts,
+            'max_drawdown': ((high_water_mark - close_windows) / high_water_mark * 100).max(axis=-1)
+        })
+
+    return results
+
+
+def calculate_pnl_metrics(pnl_df, frequencies=('D', 'W', 'M'), rolling_days=None, initial_capital=1e7, by=None,
+                          year=2024):
+    """
+    Calculate PnL metrics at several frequencies in one pass over in-memory backtest output.
+
+    Works on the PnL data returned by run_vwap_backtest / backtest_vwap_strategy, or on the long-format pnl_paths
+    of backtest_vwap_sweep with by=['candidate', 'cost_scenario'] (every path then needs the same Date sequence).
+    Unlike calculate_daily_pnl_metrics, the returns are compounded from the capital and the exposures are the
+    actual Long and Short columns.
+
+    :param pnl_df: A pandas DataFrame with the columns Date, Capital, Return, Turnover, Long and Short, in time order
+    :param frequencies: Period frequencies: 'D' (day), 'W' (ISO week) and/or 'M' (month)
+    :param rolling_days: Optional list of rolling window lengths, in days
+    :param initial_capital: Capital before the first interval of every path
+    :param by: Optional list of columns identifying separate PnL paths
+    :param year: Calendar year of the 'mmdd' dates (used for the ISO weeks)
+    :return: A dictionary of frequency ('D', 'W', 'M' or 'rolling_<n>d') -> DataFrame with one row per (path and)
+             period and the columns from, to, intervals, return, gross_return, sharpe, turnover, long, short and
+             max_drawdown. See calculate_pnl_metrics_arrays for the definitions.
+    """
+    with profile_stage('pnl_metrics.engine', rows=len(pnl_df)):
+        by = list(by or [])
+        if by:
+            path_codes, paths = pd.MultiIndex.from_frame(pnl_df[by]).factorize()
+            order = np.argsort(path_codes, kind='stable')
+            n_paths = len(paths)
+        else:
+            order = np.arange(len(pnl_df))
+            n_paths = 1
+        if len(pnl_df) % n_paths:
+            raise ValueError("Every PnL path must have the same number of intervals")
+
+        def path_array(column):
+            return pnl_df[column].to_numpy(dtype=np.float64)[order].reshape(n_paths, -1)
 
+        dates = pnl_df['Date'].to_numpy()[order[:len(pnl_df) // n_paths]]
+        results = calculate_pnl_metrics_arrays(dates, path_array('Capital'), path_array('Return'),
+                                               path_array('Turnover'), path_array('Long'), path_array('Short'),
+                                               initial_capital, frequencies, rolling_days, year)
 
+        metrics_dfs = {}
+        for frequency, (periods, metrics) in results.items():
+            n_periods = len(periods)
+            metrics_df = pd.DataFrame({
+                **{name: paths.get_level_values(level).repeat(n_periods) for level, name in enumerate(by)},
+                'from': np.tile(periods['from'].to_numpy(), n_paths),
+                'to': np.tile(periods['to'].to_numpy(), n_paths),
+                **{name: values.reshape(-1) for name, values in metrics.items()}
+            })
+            metrics_dfs[frequency] = metrics_df
 
+    return metrics_dfs
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import tracemalloc
+import pandas as pd
+
+
+# Profiling is opt-in: call enable_profiling(), or set MMEP_PROFILE=1 (MMEP_PROFILE=memory also tracks memory)
+_state = {'enabled': False, 'track_memory': False, 'records': [], 'stack': []}
+
+
+def enable_profiling(track_memory=False):
+    """
+    Start recording stage timings.
+
+    :param track_memory: Also record traced memory deltas and peaks (slower; uses tracemalloc)
+    """
+    _state['enabled'] = True
+    _state['track_memory'] = track_memory
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable_profiling():
+    """
+    Stop recording stage timings. Records collected so far are kept until reset_profiling().
+    """
+    _state['enabled'] = False
+    if _state['track_memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _state['track_memory'] = False
+
+
+def reset_profiling():
+    """
+    Discard all recorded stage timings.
+    """
+    _state['records'] = []
+
+
+def profiling_enabled():
+    return _state['enabled']
+
+
+class _NullStage:
+    """
+    Stand-in for _Stage when profiling is disabled; setting rows on it has no effect.
+    """
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """
+    Context manager recording wall time, CPU time, rows processed and memory of one stage.
+    """
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.parent = _state['stack'][-1] if _state['stack'] else None
+        _state['stack'].append(self.name)
+        if _state['track_memory']:
+            self.memory_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record = {
+            'stage': self.name,
+            'parent': self.parent,
+            'wall_s': time.perf_counter() - self.wall_start,
+            'cpu_s': time.process_time() - self.cpu_start,
+            'rows': self.rows
+        }
+        if _state['track_memory']:
+            current, peak = tracemalloc.get_traced_memory()
+            record['memory_delta_mb'] = (current - self.memory_start) / 2 ** 20
+            record['peak_mb'] = (peak - self.memory_start) / 2 ** 20
+        _state['stack'].pop()
+        _state['records'].append(record)
+        return False
+
+
+def profile_stage(name, rows=None):
+    """
+    Context manager timing one stage when profiling is enabled (a no-op otherwise).
+
+    Nested stages are recorded with their parent stage. Peak memory is measured since the start of the stage, so
+    for an enclosing stage it only covers the part after its last nested stage started.
+
+    :param name: Stage name, e.g. 'alpha_factors.alpha1'
+    :param rows: Number of rows processed by the stage, if known
+    :return: A context manager; its rows attribute can still be set inside the block.
+    """
+    if not _state['enabled']:
+        return _NULL_STAGE
+    return _Stage(name, rows)
+
+
+def profiling_records():
+    """
+    :return: A list with one dictionary per recorded stage call.
+    """
+    return list(_state['records'])
+
+
+def profiling_report(fmt='table'):
+    """
+    Summarize the recorded stage timings.
+
+    :param fmt: 'table' for a DataFrame with one row per stage (calls, total wall/CPU time, rows and memory), or
+                'json' for a JSON string of the individual records
+    :return: The summary DataFrame or JSON string.
+    """
+    records = profiling_records()
+    if fmt == 'json':
+        return json.dumps(records, indent=1)
+    if fmt != 'table':
+        raise ValueError(f"Unknown report format: {fmt}")
+
+    columns = ['stage', 'calls', 'wall_s', 'cpu_s', 'rows', 'memory_delta_mb', 'peak_mb']
+    if not records:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame(records)
+    aggregations = {'calls': ('wall_s', 'size'), 'wall_s': ('wall_s', 'sum'), 'cpu_s': ('cpu_s', 'sum'),
+                    'rows': ('rows', 'sum')}
+    if 'memory_delta_mb' in df:
+        aggregations['memory_delta_mb'] = ('memory_delta_mb', 'sum')
+        aggregations['peak_mb'] = ('peak_mb', 'max')
+    summary = df.groupby('stage', sort=False).agg(**aggregations).reset_index()
+    return summary.sort_values('wall_s', ascending=False, ignore_index=True)
+
+
+def write_profiling_report(output_file):
+    """
+    Write the recorded stage timings to a JSON file.
+
+    :param output_file: Path of the JSON file
+    """
+    with open(output_file, 'w') as f:
+        f.write(profiling_report('json'))
+
+
+if os.environ.get('MMEP_PROFILE'):
+    enable_profiling(track_memory=os.environ['MMEP_PROFILE'] == 'memory')